@@ -1,12 +1,9 @@
 __version__ = "0.1.0"
 
-try:
-    from .utils import ensure_r_ready
-    ensure_r_ready()
-except Exception as e:
-    print(f"[gp_utils] Warning: R environment not ready ({e}). Some R-related functions may not work.")
+# R-backed classes and functions start R through utils.get_backend("R") on first use,
+# so importing gp_utils does not require R.
 
-from .preprocessing import str2numConverter
+from .preprocessing import str2numConverter, GenotypeMatrix
 from .reducers import NoOpReducer, LassoReducer, init_reducer
 from .models import RRBLUPModel, BayesAModel, BayesBModel, BayesLASSOModel, EGBLUPModel, init_model
 from .simCross import read_cross_func, map_snp_order_func, sim_cross_with_genos
@@ -14,7 +11,7 @@ from .evaluations import pear_metric, pear_scorer, spear_metric, spear_scorer, t
 from .pipeline import init_pipeline, train_pipeline
 
 __all__ = [
-    "str2numConverter",
+    "str2numConverter", "GenotypeMatrix",
     "NoOpReducer", "LassoReducer", "init_reducer",
     "RRBLUPModel", "BayesAModel", "BayesBModel", "BayesLASSOModel", "EGBLUPModel", "init_model",
     "read_cross_func", "map_snp_order_func", "sim_cross_with_genos",
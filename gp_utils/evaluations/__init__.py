@@ -1,4 +1,6 @@
 from .metrics import pear_metric, pear_scorer, spear_metric, spear_scorer, top_r_portion_hit_rate, report_metrics, compute_top_mean
+from .batch import pearson_batch, spearman_batch, top_r_mask, top_r_hit_rate_batch, top_mean_batch, report_metrics_batch, grouped_metrics, bootstrap_ci
+from .streaming import PearsonAccumulator, TopMeanAccumulator, TopHitRateAccumulator, MetricsAccumulator
 
 __all__ = [
     "pear_metric",
@@ -7,5 +9,17 @@ __all__ = [
     "spear_scorer",
     "top_r_portion_hit_rate",
     "report_metrics",
-    "compute_top_mean"
+    "compute_top_mean",
+    "pearson_batch",
+    "spearman_batch",
+    "top_r_mask",
+    "top_r_hit_rate_batch",
+    "top_mean_batch",
+    "report_metrics_batch",
+    "grouped_metrics",
+    "bootstrap_ci",
+    "PearsonAccumulator",
+    "TopMeanAccumulator",
+    "TopHitRateAccumulator",
+    "MetricsAccumulator"
 ]
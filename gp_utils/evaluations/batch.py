@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+#########################################
+### Batched metrics (units x samples) ###
+#########################################
+def pearson_batch(Y_true, Y_pred):
+    '''
+    Pearson's r of every unit (row) at once.
+    Y_true, Y_pred: arrays of shape (n_units, n_samples). Constant rows give nan.
+    '''
+    Y_true, Y_pred = _as_2d(Y_true), _as_2d(Y_pred)
+    xm = Y_true - Y_true.mean(axis=1, keepdims=True)
+    ym = Y_pred - Y_pred.mean(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r = np.einsum("ij,ij->i", xm, ym) / np.sqrt(np.einsum("ij,ij->i", xm, xm) * np.einsum("ij,ij->i", ym, ym))
+    return np.clip(r, -1.0, 1.0)
+
+
+def spearman_batch(Y_true, Y_pred):
+    '''Spearman's rho of every unit: Pearson's r of average ranks within each row.'''
+    return pearson_batch(stats.rankdata(_as_2d(Y_true), axis=1), stats.rankdata(_as_2d(Y_pred), axis=1))
+
+
+def top_r_mask(Y, r=0.25):
+    '''
+    Boolean mask of the top k = max(1, int(n * r)) values of every row: the last k entries of np.argsort,
+    as in top_r_portion_hit_rate. Rows are split with np.argpartition; only rows whose k-th largest value
+    is tied with values left out of the top k are fully sorted, as their tie order is np.argsort's.
+    '''
+    if not (0 <= r <= 1):
+        raise ValueError("r must be in the interval [0, 1]")
+    Y = _as_2d(Y)
+    n = Y.shape[1]
+    k = max(1, int(n * r))  # Ensure at least one element is considered
+    rows = np.arange(Y.shape[0])[:, np.newaxis]
+    kth = Y[rows, np.argpartition(Y, n - k, axis=1)[:, [n - k]]] # k-th largest value of each row
+    mask = Y >= kth
+    ambiguous = np.flatnonzero(mask.sum(axis=1) > k) # Ties at the boundary
+    if ambiguous.size:
+        mask[ambiguous] = False
+        mask[ambiguous[:, np.newaxis], np.argsort(Y[ambiguous], axis=1)[:, n - k:]] = True
+    return mask
+
+
+def top_r_hit_rate_batch(Y_true, Y_pred, r=0.25):
+    '''Share of the true top r portion of every unit that is also in its predicted top r portion.'''
+    top_true, top_pred = top_r_mask(Y_true, r=r), top_r_mask(Y_pred, r=r)
+    return (top_true & top_pred).sum(axis=1) / top_true.sum(axis=1)
+
+
+def top_mean_batch(Y, r):
+    '''Mean of the top r portion of every row (see compute_top_mean).'''
+    Y = _as_2d(Y)
+    k = max(1, int(Y.shape[1] * r))  # Ensure at least one element is considered
+    return np.sort(np.partition(Y, Y.shape[1] - k, axis=1)[:, Y.shape[1] - k:], axis=1).mean(axis=1)
+
+
+def report_metrics_batch(Y_true, Y_pred, _r=0.25, reps=None, folds=None):
+    '''
+    report_metrics for every unit at once.
+
+    Return:
+    -------
+    pandas dataframe with one row per unit and the columns of report_metrics.
+    '''
+    Y_true, Y_pred = _as_2d(Y_true), _as_2d(Y_pred)
+    res = {}
+    if reps is not None and folds is not None:
+        res["rep"] = np.asarray(reps)
+        res["fold"] = np.asarray(folds)
+    res["Pearson's r"] = pearson_batch(Y_true, Y_pred)
+    res[f"Top {int(_r * 100)}% HR"] = top_r_hit_rate_batch(Y_true, Y_pred, r=_r)
+    res[f"Low {int(_r * 100)}% HR"] = top_r_hit_rate_batch(-Y_true, -Y_pred, r=_r)
+    return pd.DataFrame(res)
+
+
+def grouped_metrics(y_true, y_pred, groups, _r=0.25):
+    '''
+    report_metrics for long-format predictions, one row per group (e.g. groups=[rep, fold]).
+    Groups of equal size are evaluated together as one 2-D batch; samples keep their order within groups.
+
+    groups: array of group labels, or list of arrays combined into a MultiIndex.
+
+    Return:
+    -------
+    pandas dataframe indexed by group.
+    '''
+    y_true, y_pred = np.asarray(y_true, dtype=float), np.asarray(y_pred, dtype=float)
+    keys = pd.MultiIndex.from_arrays(groups) if isinstance(groups, list) else pd.Index(groups)
+    codes, labels = pd.factorize(keys, sort=True)
+    order = np.argsort(codes, kind="stable")
+    sizes = np.bincount(codes, minlength=len(labels))
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+
+    parts = []
+    for size in np.unique(sizes):
+        group_ids = np.flatnonzero(sizes == size)
+        idx = order[starts[group_ids][:, np.newaxis] + np.arange(size)]
+        parts.append(report_metrics_batch(y_true[idx], y_pred[idx], _r=_r).set_index(group_ids))
+    res = pd.concat(parts).sort_index()
+    res.index = labels
+    return res
+
+
+def bootstrap_ci(Y_true, Y_pred, metric=pearson_batch, n_boot=1000, alpha=0.05, random_state=None, max_values=2 ** 22):
+    '''
+    Percentile bootstrap confidence intervals of a batched metric for every unit.
+    Resamples are evaluated as batches of rows, in chunks of at most about max_values resampled values
+    (units x resamples x samples), which bounds the index and gathered arrays of a chunk.
+
+    metric: batched metric taking (Y_true, Y_pred), e.g. pearson_batch or spearman_batch.
+
+    Return:
+    -------
+    (lower, upper) arrays of shape (n_units,).
+    '''
+    Y_true, Y_pred = _as_2d(Y_true), _as_2d(Y_pred)
+    n_units, n = Y_true.shape
+    rng = np.random.default_rng(random_state)
+    boot = np.empty((n_units, n_boot))
+    boots_per_chunk = min(n_boot, max(1, max_values // n))
+    units_per_chunk = max(1, max_values // (n_boot * n)) if boots_per_chunk == n_boot else 1
+    for start in range(0, n_units, units_per_chunk):
+        units = np.arange(start, min(start + units_per_chunk, n_units))
+        rows = units[:, np.newaxis, np.newaxis]
+        for b in range(0, n_boot, boots_per_chunk):
+            size = min(boots_per_chunk, n_boot - b)
+            idx = rng.integers(0, n, size=(units.size, size, n))
+            boot[units, b:b + size] = metric(Y_true[rows, idx].reshape(-1, n), Y_pred[rows, idx].reshape(-1, n)).reshape(units.size, size)
+    lower, upper = np.nanquantile(boot, [alpha / 2, 1 - alpha / 2], axis=1)
+    return lower, upper
+
+### Internal utilities ###
+def _as_2d(Y):
+    Y = np.asarray(Y, dtype=float)
+    return Y[np.newaxis, :] if Y.ndim == 1 else Y
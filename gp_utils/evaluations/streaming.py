@@ -0,0 +1,200 @@
+import numpy as np
+
+#####################################
+### Streaming metric accumulators ###
+#####################################
+class PearsonAccumulator:
+    '''
+    Pearson's r of a stream of (y_true, y_pred) chunks, from running means and centered sums of
+    squares and cross-products. Chunks are summarized on their own, then combined with the pairwise
+    update of Chan et al., so accumulators fed by different workers can be merged in any order.
+    '''
+    def __init__(self):
+        self.n = 0
+        self.mean_true = 0.0
+        self.mean_pred = 0.0
+        self.ss_true = 0.0
+        self.ss_pred = 0.0
+        self.sp = 0.0
+
+    def update(self, y_true, y_pred):
+        y_true, y_pred = np.asarray(y_true, dtype=float).ravel(), np.asarray(y_pred, dtype=float).ravel()
+        if y_true.size == 0:
+            return self
+        chunk = PearsonAccumulator()
+        chunk.n = y_true.size
+        chunk.mean_true, chunk.mean_pred = y_true.mean(), y_pred.mean()
+        dt, dp = y_true - chunk.mean_true, y_pred - chunk.mean_pred
+        chunk.ss_true, chunk.ss_pred, chunk.sp = dt @ dt, dp @ dp, dt @ dp
+        return self.merge(chunk)
+
+    def merge(self, other):
+        n = self.n + other.n
+        if other.n == 0:
+            return self
+        dt, dp = other.mean_true - self.mean_true, other.mean_pred - self.mean_pred
+        w = self.n * other.n / n
+        self.ss_true += other.ss_true + dt * dt * w
+        self.ss_pred += other.ss_pred + dp * dp * w
+        self.sp += other.sp + dt * dp * w
+        self.mean_true += dt * other.n / n
+        self.mean_pred += dp * other.n / n
+        self.n = n
+        return self
+
+    def result(self):
+        '''Pearson's r of all values seen (nan if either side is constant).'''
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return float(np.clip(self.sp / np.sqrt(self.ss_true * self.ss_pred), -1.0, 1.0))
+
+
+class TopMeanAccumulator:
+    '''
+    Mean of the k largest values of a stream (see compute_top_mean), keeping at most k values.
+    Give k, or the top portion r together with the total stream length n_total (k = max(1, int(n_total * r))).
+    '''
+    def __init__(self, k=None, r=None, n_total=None):
+        self.k = _top_k_size(k, r, n_total)
+        self.n = 0
+        self.top = np.empty(0)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        self.n += values.size
+        self.top = _keep_largest(self.top, self.k, new=values)
+        return self
+
+    def merge(self, other):
+        if other.k != self.k:
+            raise ValueError("Cannot merge accumulators with different k.")
+        self.n += other.n
+        self.top = _keep_largest(self.top, self.k, new=other.top)
+        return self
+
+    def result(self):
+        if self.n < self.k:
+            raise ValueError(f"Only {self.n} values seen, fewer than k={self.k}.")
+        return np.sort(self.top).mean()
+
+
+class TopHitRateAccumulator:
+    '''
+    Exact top r portion hit rate of a stream of (y_true, y_pred) chunks (see top_r_portion_hit_rate).
+    The k = max(1, int(n_total * r)) largest true and predicted values are kept with their positions in the
+    stream, and the hit rate is the overlap of both position sets. The result equals top_r_portion_hit_rate on the
+    concatenated stream, except when values tie at the top-k boundary: ties then go to the later positions,
+    whereas top_r_portion_hit_rate keeps np.argsort's order, which depends on the whole array.
+
+    Parameters
+    ----------
+    n_total: total number of samples of the stream.
+    r: float between 0 and 1.
+    '''
+    def __init__(self, n_total, r=0.25):
+        self.k = _top_k_size(None, r, n_total)
+        self.n_total = n_total
+        self.r = r
+        self.n = 0
+        self.top_true = (np.empty(0), np.empty(0, dtype=np.int64))
+        self.top_pred = (np.empty(0), np.empty(0, dtype=np.int64))
+
+    def update(self, y_true, y_pred, index=None):
+        '''
+        index: positions of the chunk in the whole stream. Defaults to the positions following the values seen
+               by this accumulator; pass it when chunks are scored out of order or by several merged accumulators.
+        '''
+        y_true, y_pred = np.asarray(y_true, dtype=float).ravel(), np.asarray(y_pred, dtype=float).ravel()
+        index = self.n + np.arange(y_true.size) if index is None else np.asarray(index, dtype=np.int64).ravel()
+        self.n += y_true.size
+        self.top_true = _keep_top(self.top_true, (y_true, index), self.k)
+        self.top_pred = _keep_top(self.top_pred, (y_pred, index), self.k)
+        return self
+
+    def merge(self, other):
+        if other.k != self.k:
+            raise ValueError("Cannot merge accumulators of different stream lengths or portions.")
+        self.n += other.n
+        self.top_true = _keep_top(self.top_true, other.top_true, self.k)
+        self.top_pred = _keep_top(self.top_pred, other.top_pred, self.k)
+        return self
+
+    def result(self):
+        if self.n != self.n_total:
+            raise ValueError(f"{self.n} samples seen, expected n_total={self.n_total}.")
+        return np.intersect1d(self.top_true[1], self.top_pred[1]).size / self.k
+
+
+class MetricsAccumulator:
+    '''
+    report_metrics of a stream of (y_true, y_pred) chunks: Pearson's r and the top and low r portion hit rates.
+
+    Parameters
+    ----------
+    n_total: total number of samples of the stream.
+    _r: float between 0 and 1.
+    '''
+    def __init__(self, n_total, _r=0.25):
+        self._r = _r
+        self.pearson = PearsonAccumulator()
+        self.top = TopHitRateAccumulator(n_total, r=_r)
+        self.low = TopHitRateAccumulator(n_total, r=_r)
+
+    def update(self, y_true, y_pred, index=None):
+        y_true, y_pred = np.asarray(y_true, dtype=float), np.asarray(y_pred, dtype=float)
+        self.pearson.update(y_true, y_pred)
+        self.top.update(y_true, y_pred, index=index)
+        self.low.update(-y_true, -y_pred, index=index)
+        return self
+
+    def merge(self, other):
+        self.pearson.merge(other.pearson)
+        self.top.merge(other.top)
+        self.low.merge(other.low)
+        return self
+
+    def result(self, rep=None, fold=None):
+        res = {}
+        if rep and fold:
+            res["rep"] = rep
+            res["fold"] = fold
+        res["Pearson's r"] = self.pearson.result()
+        res[f"Top {int(self._r * 100)}% HR"] = self.top.result()
+        res[f"Low {int(self._r * 100)}% HR"] = self.low.result()
+        return res
+
+### Internal utilities ###
+def _top_k_size(k, r, n_total):
+    if k is not None:
+        return int(k)
+    if r is None or n_total is None:
+        raise ValueError("Give k, or both r and n_total.")
+    if not (0 <= r <= 1):
+        raise ValueError("r must be in the interval [0, 1]")
+    return max(1, int(n_total * r))  # Ensure at least one element is considered
+
+
+def _keep_largest(values, k, new=None):
+    if new is not None:
+        if values.size == k:
+            new = new[new > values.min()] # Only values above the current k-th largest can enter
+        values = np.concatenate((values, new))
+    if values.size <= k:
+        return values
+    return np.partition(values, values.size - k)[values.size - k:]
+
+
+def _keep_top(current, new, k):
+    '''k largest (value, position) pairs of both sets, ties going to the later positions.'''
+    if current[0].size == k:
+        # Only values reaching the current k-th largest can enter
+        entering = new[0] >= current[0].min()
+        new = (new[0][entering], new[1][entering])
+    values, index = np.concatenate((current[0], new[0])), np.concatenate((current[1], new[1]))
+    if values.size <= k:
+        return values, index
+    kth = np.partition(values, values.size - k)[values.size - k]
+    above = np.flatnonzero(values > kth)
+    tied = np.flatnonzero(values == kth)
+    tied = tied[np.argsort(index[tied], kind="stable")[tied.size - (k - above.size):]]
+    keep = np.concatenate((above, tied))
+    return values[keep], index[keep]
@@ -1,4 +1,4 @@
-from .models import RRBLUPModel, BayesAModel, BayesBModel, BayesLASSOModel, EGBLUPModel, init_model
+from .models import RRBLUPModel, BayesAModel, BayesBModel, BayesLASSOModel, EGBLUPModel, init_model, benchmark_egblup_rank
 
 __all__ = [
     "RRBLUPModel",
@@ -6,5 +6,6 @@ __all__ = [
     "BayesBModel",
     "BayesLASSOModel",
     "EGBLUPModel",
-    "init_model"
+    "init_model",
+    "benchmark_egblup_rank"
 ]
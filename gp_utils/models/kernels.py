@@ -0,0 +1,120 @@
+import numpy as np
+from scipy import linalg, optimize
+
+############################################
+### Additive and epistatic GBLUP kernels ###
+############################################
+def additive_kernel_params(X, min_maf=None):
+    '''
+    Centering and scaling of rrBLUP::A.mat for a complete marker matrix coded -1/0/1.
+
+    Return:
+    -------
+    dict with the kept markers "markers" (MAF >= min_maf, default 1/(2n)), their allele
+    frequencies "freq" and the kernel scale "scale" = 2 * sum(freq * (1 - freq)).
+    '''
+    n = X.shape[0]
+    freq = (X.mean(axis=0) + 1) / 2
+    maf = np.minimum(freq, 1 - freq)
+    markers = maf >= (1 / (2 * n) if min_maf is None else min_maf)
+    freq = freq[markers]
+    return {"markers": markers, "freq": freq, "scale": 2 * np.sum(freq * (1 - freq))}
+
+
+def center_genotypes(X, params):
+    '''W = X + 1 - 2 freq on the kept markers, as in A.mat.'''
+    return X[:, params["markers"]] + 1 - 2 * params["freq"]
+
+
+def additive_kernel(W1, W2, params):
+    '''Additive relationship between two centered genotype matrices, A = W1 W2' / scale.'''
+    return W1 @ W2.T / params["scale"]
+
+
+def blup_weights(kernels, weights, Vu, Ve, y, beta):
+    '''
+    alpha = V^-1 (y - beta) with V = Vu * sum(weights_i * K_i) + Ve * I, so that the genetic values
+    of any lines are Vu * sum(weights_i * K_i(lines, train)) @ alpha.
+    '''
+    V = Vu * sum(w * K for w, K in zip(weights, kernels))
+    V[np.diag_indices_from(V)] += Ve
+    return linalg.cho_solve(linalg.cho_factor(V, lower=True), y - beta)
+
+################################
+### Low-rank (Nystrom) GBLUP ###
+################################
+def nystrom_map(K_landmarks, rank=None):
+    '''
+    Nystrom projection for a kernel evaluated on m landmark lines.
+    Any lines get low-rank factors L = K(lines, landmarks) @ M with L L' ~ K.
+    With all training lines as landmarks and rank=None, the factorization is exact.
+
+    K_landmarks: kernel between the landmarks, shape (m, m).
+    rank: number of leading eigenvalues kept. Defaults to every positive eigenvalue.
+
+    Return:
+    -------
+    M of shape (m, r).
+    '''
+    lam, V = np.linalg.eigh(K_landmarks)
+    order = np.argsort(lam)[::-1]
+    lam, V = lam[order], V[:, order]
+    keep = lam > lam[0] * K_landmarks.shape[0] * np.finfo(float).eps
+    if rank is not None:
+        keep[rank:] = False
+    return V[:, keep] / np.sqrt(lam[keep])
+
+
+def low_rank_reml(y, factors, X=None, bounds=(-20, 20)):
+    '''
+    REML fit of y = X beta + sum_i g_i + e with g_i ~ N(0, s_i^2 L_i L_i') and e ~ N(0, se^2 I).
+    With theta_i = s_i^2 / se^2 and F = [sqrt(theta_i) L_i], V / se^2 = I + F F' is handled through
+    the k x k matrix I + F'F (Woodbury), so every likelihood evaluation costs O(k^3) after an
+    O(n k^2) precomputation.
+
+    Parameters
+    ----------
+    y: numpy array of shape (n,).
+    factors: list of low-rank factors L_i of shape (n, r_i).
+    X: fixed effects, defaults to an intercept.
+
+    Return:
+    -------
+    dict with "beta", the variance components "sigma2" (one per factor) and "Ve", and "gamma"
+    such that the genetic values of any lines are hstack(L_i(lines)) @ gamma (see low_rank_predict).
+    '''
+    n = y.shape[0]
+    X = np.ones((n, 1)) if X is None else np.asarray(X, dtype=float).reshape(n, -1)
+    L = np.hstack(factors)
+    block = np.repeat(np.arange(len(factors)), [f.shape[1] for f in factors])
+    df = n - X.shape[1]
+
+    LtL, Lty, LtX = L.T @ L, L.T @ y, L.T @ X
+    yty, Xty, XtX = y @ y, X.T @ y, X.T @ X
+
+    def solve(log_theta):
+        d = np.sqrt(np.exp(log_theta))[block]
+        G = LtL * np.outer(d, d)
+        G[np.diag_indices_from(G)] += 1
+        cho = linalg.cho_factor(G, lower=True)
+        Fty, FtX = d * Lty, d[:, np.newaxis] * LtX
+        GiFty, GiFtX = linalg.cho_solve(cho, Fty), linalg.cho_solve(cho, FtX)
+        yVy = yty - Fty @ GiFty
+        XVy = Xty - FtX.T @ GiFty
+        XVX = XtX - FtX.T @ GiFtX
+        beta = np.linalg.solve(XVX, XVy)
+        yPy = yVy - XVy @ beta
+        logdet_G = 2 * np.sum(np.log(np.diag(cho[0])))
+        neg_ll = df * np.log(yPy) + logdet_G + np.linalg.slogdet(XVX)[1]
+        return neg_ll, beta, yPy, cho, d, Fty, FtX
+
+    res = optimize.minimize(lambda x: solve(x)[0], x0=np.zeros(len(factors)), method="L-BFGS-B", bounds=[bounds] * len(factors))
+    _, beta, yPy, cho, d, Fty, FtX = solve(res.x)
+    Ve = yPy / df
+    gamma = linalg.cho_solve(cho, Fty - FtX @ beta) * d # G^-1 F' (y - X beta), folded with sqrt(theta)
+    return {"beta": beta, "sigma2": Ve * np.exp(res.x), "Ve": Ve, "gamma": gamma}
+
+
+def low_rank_predict(factors, fit):
+    '''Genetic values plus the intercept for the low-rank factors of new lines.'''
+    return np.hstack(factors) @ fit["gamma"] + fit["beta"][0]
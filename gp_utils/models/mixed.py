@@ -0,0 +1,161 @@
+import numpy as np
+from scipy import optimize
+
+from preprocessing import is_genotype_matrix
+# from ..preprocessing import is_genotype_matrix
+
+_BLOCK_COLUMNS = 4096 # Marker columns projected at once
+
+#########################################
+### Ridge-regression BLUP (EMMA REML) ###
+#########################################
+def spectral_decomposition(Z, X=None):
+    '''
+    Eigen decomposition of S Z Z' S, where S projects out the fixed effects X (EMMA).
+    Works in kernel space (n x n) when n <= p and in marker space (p x p) otherwise.
+
+    Parameters
+    ----------
+    Z: numpy array or complete GenotypeMatrix of shape (n, p), marker matrix. Markers are projected to float64 one block of
+       columns at a time and accumulated into the n x n (or p x p) cross product, so no float64
+       copy of Z is made.
+    X: numpy array of shape (n, q), fixed effects. Defaults to an intercept.
+
+    Return:
+    -------
+    dict with the fixed effects "X", their orthonormal basis "Q", "QtZ" = Q' Z (so that S Z = Z - Q QtZ),
+    the nonzero eigenvalues "xi" (r,) and eigenvectors "U" (n, r).
+    '''
+    n, p = Z.shape
+    X = np.ones((n, 1)) if X is None else np.asarray(X, dtype=float).reshape(n, -1)
+    Q, _ = np.linalg.qr(X)
+    QtZ = np.empty((Q.shape[1], p))
+    for cols, block in _column_blocks(Z):
+        QtZ[:, cols] = Q.T @ block
+
+    if n <= p:
+        ZZt = np.zeros((n, n))
+        for cols, block in _column_blocks(Z):
+            block -= Q @ QtZ[:, cols]
+            ZZt += block @ block.T
+        xi, U = np.linalg.eigh(ZZt)
+        keep = _nonzero(xi, n, p)
+        xi, U = xi[keep], U[:, keep]
+    else:
+        ZtZ = np.empty((p, p))
+        for cols_i, block_i in _column_blocks(Z):
+            block_i -= Q @ QtZ[:, cols_i]
+            for cols_j, block_j in _column_blocks(Z, start=cols_i.start):
+                block_j -= Q @ QtZ[:, cols_j]
+                ZtZ[cols_i, cols_j] = block_i.T @ block_j
+                ZtZ[cols_j, cols_i] = ZtZ[cols_i, cols_j].T
+        xi, V = np.linalg.eigh(ZtZ)
+        keep = _nonzero(xi, n, p)
+        xi, V = xi[keep], V[:, keep]
+        U = np.zeros((n, xi.size))
+        for cols, block in _column_blocks(Z):
+            U += (block - Q @ QtZ[:, cols]) @ V[cols]
+        U /= np.sqrt(xi)
+    return {"X": X, "Q": Q, "QtZ": QtZ, "xi": xi, "U": U}
+
+
+def reml_delta(xi, eta, resid_ss, df, bounds=(1e-9, 1e9), n_grid=41):
+    '''
+    REML estimates of delta = Ve / Vu given the rotated phenotypes, for one or several traits.
+    All traits are first scored on a common log-spaced grid in one matrix product, then each
+    estimate is refined by a bounded scalar search around its best grid point.
+
+    xi: nonzero eigenvalues of S Z Z' S, shape (r,).
+    eta: projections of S y on the matching eigenvectors, shape (r,) or (r, n_traits).
+    resid_ss: squared norm of the part of S y orthogonal to those eigenvectors (eigenvalue 0), scalar or (n_traits,).
+    df: n - q.
+
+    Return:
+    -------
+    (delta, -2 REML log-likelihood up to a constant), scalars or arrays of shape (n_traits,).
+    '''
+    single = np.ndim(eta) == 1
+    eta2 = np.reshape(eta, (xi.size, -1)) ** 2
+    resid_ss = np.atleast_1d(resid_ss)
+    n_zero = df - xi.size
+
+    def neg_ll(log_delta, t=slice(None)):
+        delta = np.exp(np.atleast_1d(log_delta))[:, np.newaxis]
+        quad = (1 / (xi + delta)) @ eta2[:, t] + resid_ss[t] / delta
+        return df * np.log(quad) + (np.log(xi + delta).sum(axis=1) + n_zero * np.log(delta[:, 0]))[:, np.newaxis]
+
+    grid = np.linspace(*np.log(bounds), n_grid)
+    best = np.argmin(neg_ll(grid), axis=0)
+    delta, value = np.empty(eta2.shape[1]), np.empty(eta2.shape[1])
+    for t, g in enumerate(best):
+        lo, hi = grid[max(g - 1, 0)], grid[min(g + 1, n_grid - 1)]
+        res = optimize.minimize_scalar(lambda x: neg_ll(x, t).item(), bounds=(lo, hi), method="bounded", options={"xatol": 1e-8})
+        delta[t], value[t] = np.exp(res.x), res.fun
+    if single:
+        return delta[0], value[0]
+    return delta, value
+
+
+def mixed_solve(y, Z, X=None, decomposition=None, bounds=(1e-9, 1e9)):
+    '''
+    NumPy counterpart of rrBLUP::mixed.solve(y, Z) with K = I:
+    y = X beta + Z u + e, u ~ N(0, Vu I), e ~ N(0, Ve I), variance components by REML.
+
+    Several traits can be fitted at once: the decomposition of Z is shared and only the
+    REML search is done per trait.
+
+    Parameters
+    ----------
+    y: numpy array of shape (n,) or (n, n_traits).
+    Z: numpy array or complete GenotypeMatrix of shape (n, p).
+    X: fixed effects, defaults to an intercept.
+    decomposition: output of spectral_decomposition(Z, X), to reuse between fits on the same Z.
+
+    Return:
+    -------
+    dict with keys "u" (p,) or (p, n_traits), "beta" (q,) or (q, n_traits), "Vu", "Ve"
+    and "LL" (REML log-likelihood up to a constant), scalars or arrays of shape (n_traits,).
+    '''
+    Z = Z if is_genotype_matrix(Z) else np.asarray(Z) # Not copied to float64 (see spectral_decomposition)
+    y = np.asarray(y, dtype=float)
+    dec = spectral_decomposition(Z, X) if decomposition is None else decomposition
+    Q, U, xi = dec["Q"], dec["U"], dec["xi"]
+    df = Z.shape[0] - Q.shape[1]
+
+    ys = y - Q @ (Q.T @ y)
+    eta = U.T @ ys
+    resid_ss = np.clip(np.sum(ys ** 2, axis=0) - np.sum(eta ** 2, axis=0), 0.0, None)
+    delta, neg_ll = reml_delta(xi, eta, resid_ss, df, bounds=bounds)
+
+    # P y for H = Z Z' + delta I, expanded on the eigenvectors (zero eigenvalues in the residual part)
+    shrink = 1 / np.add.outer(xi, delta) if y.ndim == 2 else 1 / (xi + delta)
+    Py = U @ (eta * shrink) + (ys - U @ eta) / delta
+    # u = (S Z)' Py and Z u in float64, one block of markers at a time
+    u = np.empty((Z.shape[1],) + Py.shape[1:])
+    Zu = np.zeros_like(Py)
+    for cols, block in _column_blocks(Z):
+        u[cols] = (block - Q @ dec["QtZ"][:, cols]).T @ Py
+        Zu += block @ u[cols]
+    beta, *_ = np.linalg.lstsq(dec["X"], y - Zu - delta * Py, rcond=None)
+    Vu = (np.sum(eta ** 2 * shrink, axis=0) + resid_ss / delta) / df
+    return {
+        "u": u,
+        "beta": beta,
+        "Vu": Vu,
+        "Ve": delta * Vu,
+        "LL": -0.5 * (df * (np.log(2 * np.pi) + 1 - np.log(df)) + neg_ll)
+    }
+
+### Internal utilities ###
+def _column_blocks(Z, start=0):
+    '''Yield (column slice, float64 copy of those columns of Z), _BLOCK_COLUMNS markers at a time.'''
+    for first in range(start, Z.shape[1], _BLOCK_COLUMNS):
+        cols = slice(first, min(first + _BLOCK_COLUMNS, Z.shape[1]))
+        if is_genotype_matrix(Z):
+            yield cols, Z.decode(cols, dtype=np.float64)
+        else:
+            yield cols, np.array(Z[:, cols], dtype=float)
+
+
+def _nonzero(xi, n, p):
+    return xi > max(xi.max(), 0) * max(n, p) * np.finfo(float).eps
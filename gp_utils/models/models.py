@@ -1,43 +1,100 @@
-import numpy as np
+import time
 
-import rpy2.robjects as robjects
-from rpy2.robjects import default_converter
-from rpy2.robjects.conversion import localconverter
-from rpy2.robjects import numpy2ri
+import numpy as np
+import pandas as pd
 
 from sklearn.base import BaseEstimator, RegressorMixin
 from sklearn.linear_model import ElasticNet
 from sklearn.svm import SVR
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 
+from .mixed import mixed_solve
+from .gibbs import gibbs_chains
+from .kernels import additive_kernel_params, center_genotypes, additive_kernel, blup_weights, nystrom_map, low_rank_reml, low_rank_predict
+from rbridge import register_r_function, call_r
+# from ..rbridge import register_r_function, call_r
+from preprocessing import is_genotype_matrix
+# from ..preprocessing import is_genotype_matrix
+
+###################
+### R functions ###
+###################
+# Defined once per process, on the first fit that uses them (see rbridge).
+register_r_function("rrblup_fit", '''
+    rrblup_fit <- function(X, y) {
+        model <- mixed.solve(y=as.numeric(y), Z=as.matrix(X))
+        return(model)
+    }
+''', packages=["rrBLUP"])
+register_r_function("ba_fit", '''
+    ba_fit <- function(X, y) {
+        model <- wgr(y=as.numeric(y), iv=TRUE, pi=0, X=as.matrix(X)+1)
+        return(model)
+    }
+''', packages=["bWGR"])
+register_r_function("bb_fit", '''
+    bb_fit <- function(X, y) {
+        model <- wgr(y=as.numeric(y), iv=TRUE, pi=.95, X=as.matrix(X)+1)
+        return(model)
+    }
+''', packages=["bWGR"])
+register_r_function("bl_fit", '''
+    bl_fit <- function(X, y) {
+        model <- wgr(y=as.numeric(y), de=TRUE, pi=0, X=as.matrix(X)+1)
+        return(model)
+    }
+''', packages=["bWGR"])
+register_r_function("egblup_reml", '''
+    egblup_reml <- function(y, kin, epi) {
+        n <- length(y)
+        model <- emmremlMultiKernel(y=as.numeric(y),
+               X=matrix(rep(1,n), ncol=1),
+               Zlist=list(diag(n), diag(n)),
+               Klist=list(kin, epi))
+        return(model)
+    }
+''', packages=["Matrix", "EMMREML"])
+
 ################
 ### R models ###
 ################
 class RRBLUPModel(BaseEstimator, RegressorMixin):
-    def __init__(self):
+    '''
+    backend: "R" calls rrBLUP::mixed.solve. "numpy" uses the native EMMA REML solver (models.mixed),
+             which works in marker or kernel space depending on whether n or p is larger.
+
+    Multi-trait: with a 2-D y (samples x traits), u has shape (n_markers, n_traits) and predict returns
+    (n_samples, n_traits). The numpy backend decomposes X once and shares it across traits.
+    '''
+    def __init__(self, backend="R"):
         self.beta = None
         self.u = None
+        self.backend = backend
     
     def fit(self, X, y):
         '''
         X: numpy array or output of feature-engine.
-        y: pandas series.
+        y: pandas series, or pandas dataframe / 2-D numpy array with one column per trait.
         '''
-        if type(X) != np.ndarray:
-            X = X.values
-        robjects.r('''
-            rrblup_fit <- function(X, y) {
-                library(rrBLUP)
-                model <- mixed.solve(y=as.numeric(y), Z=as.matrix(X))
-                return(model)
-            }
-        ''')
-        fit_func = robjects.r['rrblup_fit']
-        with localconverter(default_converter + numpy2ri.converter):
-            model = fit_func(X, y.values)
-        with localconverter(default_converter + numpy2ri.converter):
-            self.u = np.array(model.rx2('u'))
-            self.beta = np.array(model.rx2('beta'))
+        if self.backend == "numpy" and is_genotype_matrix(X):
+            X.check_complete() # Kept packed: mixed_solve decodes it one block of markers at a time
+        else:
+            X = _as_array(X) # No copy for arrays, memory maps and single-dtype frames
+        y = np.asarray(y, dtype=float)
+        if self.backend == "R":
+            if y.ndim == 1:
+                outputs, self.r_timing_ = call_r("rrblup_fit", X, y, outputs=("u", "beta"))
+            else:
+                fits = [call_r("rrblup_fit", X, y[:, t], outputs=("u", "beta")) for t in range(y.shape[1])]
+                outputs = {key: np.column_stack([res[key] for res, _ in fits]) for key in ("u", "beta")}
+                self.r_timing_ = [timing for _, timing in fits]
+        elif self.backend == "numpy":
+            outputs = mixed_solve(y, X)
+            self.Vu_, self.Ve_ = outputs["Vu"], outputs["Ve"]
+        else:
+            raise ValueError(f"Unsupported backend: {self.backend}")
+        self.u = outputs["u"]
+        self.beta = outputs["beta"]
         self.is_fitted_ = True
         return self
     
@@ -47,36 +104,43 @@ class RRBLUPModel(BaseEstimator, RegressorMixin):
         '''
         if (not self.is_fitted_) or (self.beta is None) or (self.u is None):
             raise ValueError("Model has not been trained.")
-        if type(X) != np.ndarray:
-            X = X.values
-        return X @ self.u + self.beta
+        if is_genotype_matrix(X):
+            return _packed_dot(X, self.u) + self.beta # Decoded one block of markers at a time
+        X = np.asarray(X)
+        return _dot(X, self.u) + self.beta
 
 
 class BayesAModel(BaseEstimator, RegressorMixin):
-    def __init__(self):
+    '''
+    backend: "R" calls bWGR::wgr. "numpy" runs the native Gibbs sampler of models.gibbs with
+             n_iter, burn_in, thin, n_chains chains on n_jobs processes, seeded by random_state.
+             Per-chain posterior means are kept in chains_ and convergence diagnostics in diagnostics_.
+    '''
+    def __init__(self, backend="R", n_iter=1500, burn_in=500, thin=1, n_chains=1, n_jobs=1, random_state=None):
         self.beta = None
         self.u = None
+        self.backend = backend
+        self.n_iter = n_iter
+        self.burn_in = burn_in
+        self.thin = thin
+        self.n_chains = n_chains
+        self.n_jobs = n_jobs
+        self.random_state = random_state
 
     def fit(self, X, y):
         '''
         X: numpy array or output of feature-engine.
         y: pandas series.
         '''
-        if type(X) != np.ndarray:
-            X = X.values
-        robjects.r('''
-            ba_fit <- function(X, y) {
-            library(bWGR)
-            model <- wgr(y=as.numeric(y), iv=TRUE, pi=0, X=as.matrix(X)+1)
-            return(model)
-            }
-        ''')
-        fit_func = robjects.r['ba_fit']
-        with localconverter(default_converter + numpy2ri.converter):
-            model = fit_func(X, y.values)
-        with localconverter(default_converter + numpy2ri.converter):
-            self.u = np.array(model.rx2("b"))
-            self.beta = np.array(model.rx2("mu"))
+        X = _as_array(X)
+        if self.backend == "R":
+            outputs, self.r_timing_ = call_r("ba_fit", X, np.asarray(y, dtype=float), outputs=("b", "mu"))
+            self.u = outputs["b"]
+            self.beta = outputs["mu"]
+        elif self.backend == "numpy":
+            _fit_gibbs(self, X, y, prior="BayesA")
+        else:
+            raise ValueError(f"Unsupported backend: {self.backend}")
         self.is_fitted_ = True
         return self
     
@@ -86,36 +150,43 @@ class BayesAModel(BaseEstimator, RegressorMixin):
         '''
         if (not self.is_fitted_) or (self.beta is None) or (self.u is None):
             raise ValueError("Model has not been trained.")
-        if type(X) != np.ndarray:
-            X = X.values
-        return (X + 1) @ self.u + self.beta
+        if is_genotype_matrix(X):
+            return _packed_dot(X, self.u) + self.u.sum() + self.beta # (X + 1) @ u, decoded one block of markers at a time
+        X = np.asarray(X)
+        return _dot(X, self.u) + self.u.sum() + self.beta # (X + 1) @ u without a shifted copy of X
     
 
 class BayesBModel(BaseEstimator, RegressorMixin):
-    def __init__(self):
+    '''
+    backend: "R" calls bWGR::wgr. "numpy" runs the native Gibbs sampler of models.gibbs with
+             n_iter, burn_in, thin, n_chains chains on n_jobs processes, seeded by random_state.
+             Per-chain posterior means are kept in chains_ and convergence diagnostics in diagnostics_.
+    '''
+    def __init__(self, backend="R", n_iter=1500, burn_in=500, thin=1, n_chains=1, n_jobs=1, random_state=None):
         self.beta = None
         self.u = None
+        self.backend = backend
+        self.n_iter = n_iter
+        self.burn_in = burn_in
+        self.thin = thin
+        self.n_chains = n_chains
+        self.n_jobs = n_jobs
+        self.random_state = random_state
 
     def fit(self, X, y):
         '''
         X: numpy array or output of feature-engine.
         y: pandas series.
         '''
-        if type(X) != np.ndarray:
-            X = X.values
-        robjects.r('''
-            bb_fit <- function(X, y) {
-            library(bWGR)
-            model <- wgr(y=as.numeric(y), iv=TRUE, pi=.95, X=as.matrix(X)+1)
-            return(model)
-            }
-        ''')
-        fit_func = robjects.r['bb_fit']
-        with localconverter(default_converter + numpy2ri.converter):
-            model = fit_func(X, y.values)
-        with localconverter(default_converter + numpy2ri.converter):
-            self.u = np.array(model.rx2("b"))
-            self.beta = np.array(model.rx2("mu"))
+        X = _as_array(X)
+        if self.backend == "R":
+            outputs, self.r_timing_ = call_r("bb_fit", X, np.asarray(y, dtype=float), outputs=("b", "mu"))
+            self.u = outputs["b"]
+            self.beta = outputs["mu"]
+        elif self.backend == "numpy":
+            _fit_gibbs(self, X, y, prior="BayesB")
+        else:
+            raise ValueError(f"Unsupported backend: {self.backend}")
         self.is_fitted_ = True
         return self
     
@@ -125,9 +196,10 @@ class BayesBModel(BaseEstimator, RegressorMixin):
         '''
         if (not self.is_fitted_) or (self.beta is None) or (self.u is None):
             raise ValueError("Model has not been trained.")
-        if type(X) != np.ndarray:
-            X = X.values
-        return (X + 1) @ self.u + self.beta
+        if is_genotype_matrix(X):
+            return _packed_dot(X, self.u) + self.u.sum() + self.beta # (X + 1) @ u, decoded one block of markers at a time
+        X = np.asarray(X)
+        return _dot(X, self.u) + self.u.sum() + self.beta # (X + 1) @ u without a shifted copy of X
 
 
 # class BayesRRModel(BaseEstimator, RegressorMixin):
@@ -170,30 +242,36 @@ class BayesBModel(BaseEstimator, RegressorMixin):
     
 
 class BayesLASSOModel(BaseEstimator, RegressorMixin):
-    def __init__(self):
+    '''
+    backend: "R" calls bWGR::wgr. "numpy" runs the native Gibbs sampler of models.gibbs with
+             n_iter, burn_in, thin, n_chains chains on n_jobs processes, seeded by random_state.
+             Per-chain posterior means are kept in chains_ and convergence diagnostics in diagnostics_.
+    '''
+    def __init__(self, backend="R", n_iter=1500, burn_in=500, thin=1, n_chains=1, n_jobs=1, random_state=None):
         self.beta = None
         self.u = None
+        self.backend = backend
+        self.n_iter = n_iter
+        self.burn_in = burn_in
+        self.thin = thin
+        self.n_chains = n_chains
+        self.n_jobs = n_jobs
+        self.random_state = random_state
 
     def fit(self, X, y):
         '''
         X: numpy array or output of feature-engine.
         y: pandas series.
         '''
-        if type(X) != np.ndarray:
-            X = X.values
-        robjects.r('''
-            bl_fit <- function(X, y) {
-            library(bWGR)
-            model <- wgr(y=as.numeric(y), de=TRUE, pi=0, X=as.matrix(X)+1)
-            return(model)
-            }
-        ''')
-        fit_func = robjects.r['bl_fit']
-        with localconverter(default_converter + numpy2ri.converter):
-            model = fit_func(X, y.values)
-        with localconverter(default_converter + numpy2ri.converter):
-            self.u = np.array(model.rx2("b"))
-            self.beta = np.array(model.rx2("mu"))
+        X = _as_array(X)
+        if self.backend == "R":
+            outputs, self.r_timing_ = call_r("bl_fit", X, np.asarray(y, dtype=float), outputs=("b", "mu"))
+            self.u = outputs["b"]
+            self.beta = outputs["mu"]
+        elif self.backend == "numpy":
+            _fit_gibbs(self, X, y, prior="BayesLASSO")
+        else:
+            raise ValueError(f"Unsupported backend: {self.backend}")
         self.is_fitted_ = True
         return self
     
@@ -203,25 +281,105 @@ class BayesLASSOModel(BaseEstimator, RegressorMixin):
         '''
         if (not self.is_fitted_) or (self.beta is None) or (self.u is None):
             raise ValueError("Model has not been trained.")
-        if type(X) != np.ndarray:
-            X = X.values
-        return (X + 1) @ self.u + self.beta
+        if is_genotype_matrix(X):
+            return _packed_dot(X, self.u) + self.u.sum() + self.beta # (X + 1) @ u, decoded one block of markers at a time
+        X = np.asarray(X)
+        return _dot(X, self.u) + self.u.sum() + self.beta # (X + 1) @ u without a shifted copy of X
+
+
+def _as_array(X):
+    '''X as a numpy array. A GenotypeMatrix is decoded to float32 and must be complete: missing genotypes would be NaN.'''
+    if is_genotype_matrix(X):
+        X.check_complete()
+    return np.asarray(X)
+
+
+def _packed_dot(X, u):
+    '''X @ u for a GenotypeMatrix, rejecting matrices with missing genotypes (their NaN would propagate to predictions).'''
+    res = X.dot(u)
+    if np.isnan(res).any():
+        X.check_complete()
+    return res
+
+
+def _dot(X, u):
+    '''X @ u in the precision of X: float32 genotypes are not upcast to a float64 copy.'''
+    return X @ (u.astype(X.dtype) if X.dtype == np.float32 else u)
+
+
+def _fit_gibbs(model, X, y, prior):
+    '''
+    Fit a Bayesian marker model with the native Gibbs sampler. The sampler works on X directly;
+    beta absorbs the shift so that predict keeps the (X + 1) @ u + beta form of the bWGR models.
+    '''
+    res = gibbs_chains(
+        X, np.asarray(y, dtype=float), prior=prior,
+        n_iter=model.n_iter, burn_in=model.burn_in, thin=model.thin,
+        n_chains=model.n_chains, n_jobs=model.n_jobs, random_state=model.random_state
+    )
+    model.u = res["b"]
+    model.beta = np.array([res["mu"] - res["b"].sum()])
+    model.chains_ = res["chains"]
+    model.diagnostics_ = res["diagnostics"]
 
 
 class EGBLUPModel(BaseEstimator, RegressorMixin):
-    def __init__(self):
+    '''
+    Additive + epistatic GBLUP. fit computes the additive kernel (as rrBLUP::A.mat) and its Hadamard
+    square on the training lines, estimates the variance components and solves for the BLUP weights once.
+    predict only needs the kernels between new and training (or landmark) lines.
+
+    backend: "R" estimates the variance components with EMMREML::emmremlMultiKernel.
+             "numpy" uses the native REML of models.kernels on exact kernel factors.
+    rank: if not None, approximate both kernels with rank-r Nystrom factors from r randomly chosen
+          landmark lines and fit in the reduced space at O(n r^2) cost (native REML, any backend).
+    random_state: seeds the choice of landmark lines.
+    '''
+    def __init__(self, backend="R", rank=None, random_state=None):
         self.genos = None
         self.phenos = None
+        self.backend = backend
+        self.rank = rank
+        self.random_state = random_state
 
     def fit(self, X, y):
         '''
         X: numpy array or output of feature-engine.
         y: pandas series.
         '''
-        if type(X) != np.ndarray:
-            X = X.values
+        X = _as_array(X)
         self.genos = X
-        self.phenos = y.values
+        self.phenos = np.asarray(y, dtype=float)
+        self.kernel_params_ = additive_kernel_params(X)
+        W = center_genotypes(X, self.kernel_params_)
+
+        if self.rank is not None or self.backend == "numpy":
+            if self.rank is not None and self.rank < X.shape[0]:
+                rng = np.random.default_rng(self.random_state)
+                landmarks = np.sort(rng.choice(X.shape[0], size=self.rank, replace=False))
+            else:
+                landmarks = np.arange(X.shape[0])
+            self.W_ = W[landmarks]
+            kin = additive_kernel(W, self.W_, self.kernel_params_) # (n, m)
+            kin_landmarks = kin[landmarks]
+            self.nystrom_maps_ = [nystrom_map(kin_landmarks, self.rank), nystrom_map(kin_landmarks * kin_landmarks, self.rank)]
+            self.low_rank_fit_ = low_rank_reml(self.phenos, self._factors(kin))
+            self.Vu_ = self.low_rank_fit_["sigma2"].sum()
+            self.weights_ = self.low_rank_fit_["sigma2"] / self.Vu_
+            self.Ve_ = self.low_rank_fit_["Ve"]
+            self.beta_ = self.low_rank_fit_["beta"][0]
+        elif self.backend == "R":
+            self.W_ = W
+            self.low_rank_fit_ = None
+            kin = additive_kernel(W, W, self.kernel_params_)
+            epi = kin * kin
+            outputs, self.r_timing_ = call_r("egblup_reml", self.phenos, kin, epi, outputs=("weights", "Vu", "Ve", "betahat"))
+            self.weights_ = outputs["weights"].ravel()
+            self.Vu_, self.Ve_ = outputs["Vu"].item(), outputs["Ve"].item()
+            self.beta_ = outputs["betahat"].item()
+            self.alpha_ = blup_weights([kin, epi], self.weights_, self.Vu_, self.Ve_, self.phenos, self.beta_)
+        else:
+            raise ValueError(f"Unsupported backend: {self.backend}")
         self.is_fitted_ = True
         return self
     
@@ -231,55 +389,58 @@ class EGBLUPModel(BaseEstimator, RegressorMixin):
         '''
         if (not self.is_fitted_) or (self.genos is None) or (self.phenos is None):
             raise ValueError("Model has not been trained.")
-        if type(X) != np.ndarray:
-            X = X.values
-        robjects.r('''
-            egblup_fit <- function(bigX, bigy, train_length) {
-            library(Matrix)
-            library(rrBLUP)
-            library(EMMREML)
-            total_length <- nrow(bigX)
-            test_indices <- c(rep(FALSE, train_length), rep(TRUE, total_length-train_length))
-
-            kin <- A.mat(bigX)
-            epi <- kin * kin
-            
-            model <- emmremlMultiKernel(y=as.numeric(bigy[!test_indices]),
-                   X=matrix(rep(1,train_length), ncol=1),
-                   Zlist=list(as.matrix(diag(total_length)[!test_indices,]), as.matrix(diag(total_length)[!test_indices,])),
-                   Klist=list(as.matrix(kin), as.matrix(epi)))
-            return(model)
-            }
-        ''')
-        
-        fit_func = robjects.r['egblup_fit']
-
-        bigX, bigy = self.genos, self.phenos
-        train_length = bigX.shape[0]
-        train_flag = np.array_equal(X, bigX)
-
-        if not train_flag:
-            bigX = np.vstack((bigX, X))
-            bigy = np.concatenate((bigy, np.full(X.shape[0], np.nan)))
-
-        with localconverter(default_converter + numpy2ri.converter):
-            model = fit_func(bigX, bigy, train_length)
-        
-        with localconverter(default_converter + numpy2ri.converter):
-            uhat = np.array(model.rx2("uhat"))
-            betahat = np.array(model.rx2("betahat"))
-        
-        muhat = uhat.reshape(-1, 2, order='F')
-        total_pred =  muhat.sum(axis=1) + betahat.item()
-
-        if not train_flag:
-            return total_pred[train_length:]
-
-        return total_pred
+        X = _as_array(X)
+        kin = additive_kernel(center_genotypes(X, self.kernel_params_), self.W_, self.kernel_params_)
+        if self.low_rank_fit_ is not None:
+            return low_rank_predict(self._factors(kin), self.low_rank_fit_)
+        epi = kin * kin
+        return self.Vu_ * (self.weights_[0] * kin + self.weights_[1] * epi) @ self.alpha_ + self.beta_
+
+    ### Internal utilities ###
+    def _factors(self, kin):
+        '''Additive and epistatic low-rank factors from the kernel between lines and landmarks.'''
+        return [kin @ self.nystrom_maps_[0], (kin * kin) @ self.nystrom_maps_[1]]
+
+
+def benchmark_egblup_rank(X_train, y_train, X_test, y_test, ranks, random_state=42):
+    '''
+    Accuracy versus rank of the low-rank EGBLUP against the exact native model.
+
+    Return:
+    -------
+    Pandas dataframe with one row per rank ("exact" first): fit and predict times (s), Pearson's r
+    between predictions and y_test, and Pearson's r between predictions and the exact model's predictions.
+    '''
+    y_test = np.asarray(y_test, dtype=float)
+    rows, exact_pred = [], None
+    for rank in [None] + list(ranks):
+        model = EGBLUPModel(backend="numpy", rank=rank, random_state=random_state)
+        start = time.perf_counter()
+        model.fit(X_train, y_train)
+        fitted = time.perf_counter()
+        pred = model.predict(X_test)
+        predicted = time.perf_counter()
+        exact_pred = pred if rank is None else exact_pred
+        rows.append({
+            "rank": "exact" if rank is None else rank,
+            "fit_time": fitted - start,
+            "predict_time": predicted - fitted,
+            "pearson": np.corrcoef(pred, y_test)[0, 1],
+            "pearson_vs_exact": np.corrcoef(pred, exact_pred)[0, 1]
+        })
+    return pd.DataFrame(rows)
 
 ######################
 ### Initialization ###
 ######################
+def _bayes_params(model_params, random_state):
+    '''Backend and sampler settings of the Bayesian models. Only keys present in model_params override the defaults.'''
+    keys = ["backend", "n_iter", "burn_in", "thin", "n_chains", "n_jobs"]
+    params = {key: model_params[key] for key in keys if key in model_params}
+    params["random_state"] = random_state
+    return params
+
+
 def init_model(model_name: str, model_params: dict, random_state: int = 42):
     '''
     Initialize a regressor model with the given hyperparameters.
@@ -288,15 +449,19 @@ def init_model(model_name: str, model_params: dict, random_state: int = 42):
                   Different algorithms have completely different hyperparameters.
     '''
     if model_name == "RRBLUP":
-        model = RRBLUPModel()
+        model = RRBLUPModel(backend=model_params.get("backend", "R"))
     elif model_name == "BayesA":
-        model = BayesAModel()
+        model = BayesAModel(**_bayes_params(model_params, random_state))
     elif model_name == "BayesB":
-        model = BayesBModel()
+        model = BayesBModel(**_bayes_params(model_params, random_state))
     elif model_name == "BayesLASSO":
-        model = BayesLASSOModel()
+        model = BayesLASSOModel(**_bayes_params(model_params, random_state))
     elif model_name == "EGBLUP":
-        model = EGBLUPModel()
+        model = EGBLUPModel(
+            backend=model_params.get("backend", "R"),
+            rank=model_params.get("rank"),
+            random_state=random_state
+        )
     elif model_name == "EN":
         model = ElasticNet(
             alpha=model_params["alpha"],
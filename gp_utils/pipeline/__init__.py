@@ -1,6 +1,15 @@
-from .pipeline import init_pipeline, train_pipeline
+from .pipeline import init_pipeline, train_pipeline, ArrayStepMemory
+from .search import ProcessGridSearchCV
+from .cv import run_repeated_cv
+from .benchmark import benchmark_fit_memory
+from .predict import predict_batches
 
 __all__ = [
     "init_pipeline",
-    "train_pipeline"
+    "train_pipeline",
+    "ArrayStepMemory",
+    "ProcessGridSearchCV",
+    "run_repeated_cv",
+    "benchmark_fit_memory",
+    "predict_batches"
 ]
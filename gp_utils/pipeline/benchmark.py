@@ -0,0 +1,129 @@
+import sys
+import time
+import shutil
+import resource
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .pipeline import init_pipeline
+from .search import _share_data, _load_shared
+
+###################################
+### Memory benchmark of one fit ###
+###################################
+DEFAULT_POLICIES = [
+    {"dtype": "float64", "copy": True}, # Previous behaviour
+    {"dtype": "float32", "copy": False},
+    {"dtype": "float32", "copy": False, "fused-preprocessing": True},
+]
+_RSS_UNIT = 1 if sys.platform == "darwin" else 1024 # ru_maxrss is in bytes on macOS, in kilobytes on Linux
+
+
+def benchmark_fit_memory(
+        X,
+        y,
+        preprocess_params: dict,
+        reducer_name: str,
+        reducer_params: dict,
+        model_name: str,
+        model_params: dict,
+        policies: list = None,
+        random_state: int = 42,
+):
+    '''
+    Peak resident memory (RSS) of one init_pipeline fit under several dtype / copy policies.
+
+    Every fit runs in a new spawn-based process, which first loads the data in memory, so peaks
+    do not carry over from one policy to the next. The RSS before the fit covers the interpreter,
+    imports and data; the fit's own cost is the increase of the peak over it. On Linux the peak is
+    reset after loading the data; elsewhere it is the process peak, which may be the loading itself.
+
+    Parameters
+    ----------
+    X, y, preprocess_params, reducer_name, reducer_params, model_name, model_params: pipeline and data (see init_pipeline).
+    policies: list of dicts with the init_pipeline 'dtype' and 'copy' arguments, and optionally a
+              'fused-preprocessing' flag overriding preprocess_params. Defaults to DEFAULT_POLICIES.
+
+    Return:
+    -------
+    pandas dataframe with one row per policy: dtype, copy, fused-preprocessing, RSS before the fit and
+    peak RSS during the fit (MB), fit RSS (MB, their difference) and fit time (s).
+    '''
+    policies = DEFAULT_POLICIES if policies is None else policies
+    spec = {
+        "preprocess_params": preprocess_params,
+        "reducer_name": reducer_name,
+        "reducer_params": reducer_params,
+        "model_name": model_name,
+        "model_params": model_params,
+        "random_state": random_state
+    }
+    rows = []
+    data_dir = tempfile.mkdtemp(prefix="gp_utils_benchmark_")
+    try:
+        data_paths = _share_data(X, y, data_dir)
+        for policy in policies:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                rows.append(executor.submit(_fit_once, data_paths, spec, policy).result())
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return pd.DataFrame(rows)
+
+### Internal utilities ###
+def _rss_mb(field="VmHWM"):
+    '''
+    Peak (VmHWM) or current (VmRSS) resident memory of this process, from /proc on Linux.
+    Elsewhere, the peak since the process started (ru_maxrss) for both.
+    '''
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 2 ** 10 # kB
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _RSS_UNIT / 2 ** 20
+
+
+def _reset_peak_rss():
+    '''Reset the peak RSS to the current RSS (Linux >= 4.0), so that loading the data does not count as the fit's peak.'''
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _fit_once(data_paths, spec, policy):
+    '''Load the data fully in memory (no memory maps), then fit the pipeline once and report peak RSS.'''
+    data = {name: _load_shared(path, mmap_mode=None) for name, path in data_paths.items()}
+    fused = policy.get("fused-preprocessing", spec["preprocess_params"].get("fused-preprocessing", False))
+    pipeline = init_pipeline(
+        reducer_name=spec["reducer_name"],
+        model_name=spec["model_name"],
+        preprocess_params=spec["preprocess_params"] | {"fused-preprocessing": fused},
+        reducer_params=spec["reducer_params"],
+        model_params=spec["model_params"],
+        random_state=spec["random_state"],
+        dtype=np.dtype(policy.get("dtype", "float64")).type,
+        copy=policy.get("copy", True)
+    )
+    _reset_peak_rss()
+    before = _rss_mb("VmRSS")
+    start = time.perf_counter()
+    pipeline.fit(data["X"], data["y"])
+    fit_time = time.perf_counter() - start
+    after = _rss_mb("VmHWM")
+    return {
+        "dtype": str(np.dtype(policy.get("dtype", "float64"))),
+        "copy": policy.get("copy", True),
+        "fused-preprocessing": fused,
+        "rss_before_fit_mb": before,
+        "peak_rss_mb": after,
+        "fit_rss_mb": after - before,
+        "fit_time": fit_time
+    }
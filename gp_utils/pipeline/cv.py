@@ -0,0 +1,162 @@
+import os
+import json
+import shutil
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import KFold
+from sklearn.utils import _safe_indexing
+
+from .pipeline import init_pipeline
+from .search import _share_data, _load_shared
+from evaluations import report_metrics
+# from ..evaluations import report_metrics
+
+########################################
+### Resumable repeated k-fold engine ###
+########################################
+METRICS_FILE = "metrics.csv"
+CONFIG_FILE = "config.json"
+PREDICTIONS_DIR = "predictions"
+_WORKER_STATE = {} # Per-process training data and pipeline spec, set once by _init_worker.
+
+
+def run_repeated_cv(
+        X,
+        y,
+        preprocess_params: dict,
+        reducer_name: str,
+        reducer_params: dict,
+        model_name: str,
+        model_params: dict,
+        output_dir: str,
+        n_reps: int = 10,
+        n_folds: int = 5,
+        random_state: int = 42,
+        n_jobs: int = 1,
+        r: float = 0.25,
+):
+    '''
+    Repeated k-fold cross-validation of an init_pipeline pipeline, with results streamed to output_dir.
+
+    Every (rep, fold) unit appends its report_metrics row to metrics.csv and writes its predictions
+    to predictions/rep{rep}_fold{fold}.csv as soon as it finishes. On restart with the same spec,
+    units already listed in metrics.csv are skipped, so an interrupted run only redoes unfinished units.
+    Folds of rep i come from KFold(shuffle=True) seeded by the i-th seed drawn from random_state,
+    so they are identical across restarts. Reps and folds are numbered from 1.
+
+    Parameters
+    ----------
+    X: pandas dataframe or numpy array of genotypes. y: phenotypes.
+    preprocess_params, reducer_name, reducer_params, model_name, model_params: pipeline spec (see init_pipeline).
+    output_dir: results store. config.json records the spec; restarting with another spec raises a ValueError.
+    n_jobs: number of spawn-based worker processes running units in parallel (-1 uses all cores).
+    r: portion used by the top/low hit rates.
+
+    Return:
+    -------
+    pandas dataframe of all metrics rows in output_dir, sorted by rep and fold.
+    '''
+    spec = {
+        "preprocess_params": preprocess_params,
+        "reducer_name": reducer_name,
+        "reducer_params": reducer_params,
+        "model_name": model_name,
+        "model_params": model_params,
+        "n_reps": n_reps,
+        "n_folds": n_folds,
+        "random_state": random_state,
+        "r": r,
+        "n_samples": len(y)
+    }
+    _check_config(output_dir, spec)
+    os.makedirs(os.path.join(output_dir, PREDICTIONS_DIR), exist_ok=True)
+    metrics_path = os.path.join(output_dir, METRICS_FILE)
+    done = _done_units(metrics_path)
+
+    rep_seeds = np.random.SeedSequence(random_state).generate_state(n_reps)
+    units = []
+    for rep, seed in enumerate(rep_seeds, start=1):
+        splits = KFold(n_splits=n_folds, shuffle=True, random_state=int(seed)).split(np.arange(len(y)))
+        for fold, (train, test) in enumerate(splits, start=1):
+            if (rep, fold) not in done:
+                units.append((rep, fold, train, test))
+
+    settings = {"spec": spec, "output_dir": output_dir}
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    if n_jobs == 1 or len(units) <= 1:
+        _WORKER_STATE.clear()
+        _WORKER_STATE.update(settings, X=X, y=y)
+        for unit in units:
+            _append_metrics(metrics_path, _run_unit(unit))
+    else:
+        data_dir = tempfile.mkdtemp(prefix="gp_utils_cv_")
+        try:
+            with ProcessPoolExecutor(max_workers=min(n_jobs, len(units)), mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_init_worker, initargs=(_share_data(X, y, data_dir), settings)) as executor:
+                for future in as_completed([executor.submit(_run_unit, unit) for unit in units]):
+                    _append_metrics(metrics_path, future.result()) # Only this process writes metrics.csv
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    return pd.read_csv(metrics_path).sort_values(["rep", "fold"], ignore_index=True)
+
+### Internal utilities ###
+def _check_config(output_dir, spec):
+    '''Record the spec of a new run, or check that a restarted run has the same spec.'''
+    config = json.loads(json.dumps(spec, default=str)) # Non-JSON values (e.g. a genetic map) are compared as strings
+    config_path = os.path.join(output_dir, CONFIG_FILE)
+    if os.path.exists(config_path):
+        with open(config_path) as f:
+            if json.load(f) != config:
+                raise ValueError(f"{output_dir} holds results of another cross-validation spec.")
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    with open(config_path, "w") as f:
+        json.dump(config, f, indent=2)
+
+
+def _done_units(metrics_path):
+    if not os.path.exists(metrics_path):
+        return set()
+    metrics = pd.read_csv(metrics_path, usecols=["rep", "fold"])
+    return set(zip(metrics["rep"], metrics["fold"]))
+
+
+def _append_metrics(metrics_path, row):
+    header = not os.path.exists(metrics_path)
+    pd.DataFrame([row]).to_csv(metrics_path, mode="a", index=False, header=header)
+
+
+def _init_worker(data_paths, settings):
+    _WORKER_STATE.clear()
+    _WORKER_STATE.update(settings)
+    for name, path in data_paths.items():
+        _WORKER_STATE[name] = _load_shared(path)
+
+
+def _run_unit(unit):
+    '''Fit and evaluate one (rep, fold) unit. Predictions are written before the metrics row is returned.'''
+    rep, fold, train, test = unit
+    spec, X, y = _WORKER_STATE["spec"], _WORKER_STATE["X"], _WORKER_STATE["y"]
+    pipeline = init_pipeline(
+        reducer_name=spec["reducer_name"],
+        model_name=spec["model_name"],
+        preprocess_params=spec["preprocess_params"],
+        reducer_params=spec["reducer_params"],
+        model_params=spec["model_params"],
+        random_state=spec["random_state"]
+    )
+    pipeline.fit(_safe_indexing(X, train), _safe_indexing(y, train))
+    y_true = np.asarray(_safe_indexing(y, test), dtype=float)
+    y_pred = np.asarray(pipeline.predict(_safe_indexing(X, test)), dtype=float).ravel()
+
+    # Write then rename, so a crash never leaves a truncated predictions file
+    path = os.path.join(_WORKER_STATE["output_dir"], PREDICTIONS_DIR, f"rep{rep:03d}_fold{fold:03d}.csv")
+    index = y.index[test] if isinstance(y, pd.Series) else test
+    pd.DataFrame({"sample": index, "y_true": y_true, "y_pred": y_pred}).to_csv(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+    return report_metrics(y_true, y_pred, _r=spec["r"], rep=rep, fold=fold)
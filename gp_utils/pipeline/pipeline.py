@@ -1,5 +1,10 @@
+import shutil
+import tempfile
+from functools import partial
+
 import numpy as np
 import pandas as pd
+from joblib import Memory
 
 from sklearn.pipeline import Pipeline
 from sklearn.model_selection import GridSearchCV
@@ -7,43 +12,102 @@ from sklearn.model_selection import GridSearchCV
 from sklearn.impute import SimpleImputer
 from sklearn.preprocessing import StandardScaler
 
-from feature_engine.selection import DropConstantFeatures
-
-from preprocessing import str2numConverter
+from .search import ProcessGridSearchCV
+from preprocessing import str2numConverter, MapOrderTransformer, GenotypePreprocessor, DropConstantMarkers
 from reducers import init_reducer
 from models import init_model
 from evaluations import pear_scorer
-# from ..preprocessing import str2numConverter
+# from ..preprocessing import str2numConverter, MapOrderTransformer, GenotypePreprocessor, DropConstantMarkers
 # from ..reducers import init_reducer
 # from ..models import init_model
 # from ..evaluations import pear_scorer
 
-def init_pipeline(reducer_name: str, model_name: str, preprocess_params: dict, reducer_params: dict, model_params: dict, random_state: int = 42):
+class ArrayStepMemory:
+    '''
+    Pipeline memory caching only the steps fed with numpy arrays or float dataframes (imputer, scaler, reducer).
+    Hashing a dataframe of genotype strings takes longer than refitting the steps that read it
+    (dropconstant, converter), so these run uncached; the cached steps are still keyed by the
+    content of their input, i.e. by the fold data.
+    '''
+    def __init__(self, location, verbose=0):
+        self.location = location
+        self.memory = Memory(location=location, verbose=verbose)
+
+    def cache(self, func, **kwargs):
+        cached_func = self.memory.cache(func, **kwargs)
+        def call(transformer, X, *args, **kwargs):
+            if isinstance(X, np.ndarray) or _is_float_frame(X):
+                return cached_func(transformer, X, *args, **kwargs)
+            return func(transformer, X, *args, **kwargs)
+        return call
+
+    def reduce_size(self, bytes_limit=None):
+        '''Evict least recently used entries until the cache is smaller than bytes_limit.'''
+        self.memory.reduce_size(bytes_limit=bytes_limit)
+
+
+def _is_float_frame(X):
+    return isinstance(X, pd.DataFrame) and X.shape[1] > 0 and all(pd.api.types.is_float_dtype(dtype) for dtype in X.dtypes.unique())
+
+
+def init_pipeline(reducer_name: str, model_name: str, preprocess_params: dict, reducer_params: dict, model_params: dict, random_state: int = 42, memory=None, dtype=np.float64, copy: bool = True):
     '''
     Initialize a reducer + regressor pipeline with the given hyperparameters.
 
     preprocess_params: Preprocessing configuration.
+                       Optional 'genetic-map': map dataframe or index (see simCross.read_genetic_map). If given, genotype
+                       columns are first reordered as the map and unmapped markers are dropped.
+                       Optional 'fused-preprocessing': if True, constant-marker removal, encoding, imputation
+                       and scaling run as one GenotypePreprocessor step, which encodes genotypes once to int8
+                       and writes a single output matrix (default False: four separate steps).
+                       Genotypes may also be a GenotypeMatrix (missing calls are imputed as for dataframes).
+                       GenotypePreprocessor reads it one block of markers at a time; the four-step path drops
+                       its constant markers from genotype counts, then decodes it whole to dtype.
     
     reducer_params: Hyperparameter setting for the specified reducer.
                     Different reducers have completely different hyperparameters.
     
     model_params: Hyperparameters setting for the specified algorithm.
                   Different algorithms have completely different hyperparameters.
+
+    memory: joblib.Memory, ArrayStepMemory or cache directory used by the Pipeline to cache fitted preprocessing
+            and reducer steps. Entries are keyed by the hash of the step parameters and of its input data.
+
+    dtype: float dtype of the genotype matrices passed between steps (np.float64 or np.float32). With np.float32,
+           preprocessing outputs, the Lasso reducer and marker-effect predictions stay in single precision;
+           mixed-model solvers and Gibbs samplers still compute in float64.
+
+    copy: if False, the imputer and scaler work in place on the converter output (always a new array)
+          and the NoFS reducer passes its input through.
     '''
-    dropconstant = DropConstantFeatures(missing_values='ignore')
-    str2num = str2numConverter()
-    imp = SimpleImputer(missing_values=np.nan, strategy=preprocess_params['imputation-strategy'], fill_value=preprocess_params['imputation-fill-value'])
-    scaler = StandardScaler()
+    if preprocess_params.get('fused-preprocessing', False):
+        preprocessing = [
+            ('preprocessor', GenotypePreprocessor(imputation_strategy=preprocess_params['imputation-strategy'], fill_value=preprocess_params['imputation-fill-value'], dtype=dtype))
+        ]
+    else:
+        preprocessing = [
+            ('dropconstant', DropConstantMarkers(missing_values='ignore')),
+            ('converter', str2numConverter(dtype=dtype)),
+            ('imputer', SimpleImputer(missing_values=np.nan, strategy=preprocess_params['imputation-strategy'], fill_value=preprocess_params['imputation-fill-value'], copy=copy)),
+            ('scaler', StandardScaler(copy=copy))
+        ]
     reducer_model = init_reducer(reducer_name=reducer_name, reducer_params=reducer_params, random_state=random_state)
+    if 'copy' in reducer_model.get_params():
+        reducer_model.set_params(copy=copy)
+    if getattr(reducer_model, 'requires_feature_names', lambda: False)():
+        # Label preprocessing outputs with the marker names left by constant-marker removal and imputation.
+        # Outputs are wrapped without copies, but the imputer and scaler then copy their read-only inputs.
+        for name, step in preprocessing:
+            if name != 'dropconstant': # Outputs dataframes or GenotypeMatrix inputs as they are
+                step.set_output(transform="pandas")
     regressor_model = init_model(model_name=model_name, model_params=model_params, random_state=random_state)
-    return Pipeline([
-        ('dropconstant', dropconstant),
-        ('converter', str2num),
-        ('imputer', imp),
-        ('scaler', scaler),
+    steps = []
+    if preprocess_params.get('genetic-map') is not None:
+        steps.append(('maporder', MapOrderTransformer(genmap=preprocess_params['genetic-map'])))
+    return Pipeline(steps + preprocessing + [
         (reducer_name, reducer_model),
         (model_name, regressor_model)
-    ])
+    ], memory=memory)
 
 
 def train_pipeline(
@@ -60,6 +124,12 @@ def train_pipeline(
         gridsearch_cv_folds: int = 10,
         result_path: str = None,
         run_gridsearch = False,
+        cache: bool = True,
+        cache_dir: str = None,
+        cache_size_limit = "2G",
+        n_jobs: int = 1,
+        dtype=np.float64,
+        copy: bool = True,
 ):
     '''
     Train a reducer + regressor pipeline or perform gridsearch and record results.
@@ -70,35 +140,66 @@ def train_pipeline(
     gridsearch_cv_folds: number of folds to use for gridsearch cross validation
     
     result_path: path to store gridsearch result (.csv)
+
+    cache: cache fitted preprocessing and reducer steps, so gridsearch candidates sharing them (e.g. a grid over
+           model parameters only) fit them once per fold. Without cache_dir, the cache lives in a temporary
+           directory for the gridsearch only.
+
+    n_jobs: number of worker processes of the gridsearch (-1 uses all cores). With n_jobs != 1, candidates and folds
+            run on spawn-based processes with one R session each (see ProcessGridSearchCV).
+
+    cache_dir: persistent cache directory, reused across calls. After fitting, the least recently used entries
+               are evicted until the cache fits in cache_size_limit (bytes or a string like "2G").
+
+    dtype, copy: precision and copy policy of the pipeline (see init_pipeline). Peak memory per fit under
+                 several policies can be measured with benchmark_fit_memory.
     '''
+    memory, tmp_dir = None, None
+    if cache and (run_gridsearch or cache_dir is not None):
+        if cache_dir is None:
+            tmp_dir = cache_dir = tempfile.mkdtemp(prefix="gp_utils_cache_")
+        memory = ArrayStepMemory(location=cache_dir)
+
     pipeline = init_pipeline(
         reducer_name=reducer_name,
         model_name=model_name,
         preprocess_params=preprocess_params,
         reducer_params=reducer_params,
         model_params=model_params,
-        random_state=random_state
+        random_state=random_state,
+        memory=memory,
+        dtype=dtype,
+        copy=copy
     )
+    try:
+        if run_gridsearch:
+            assert reducer_param_grid is not None
+            assert model_param_grid is not None
 
-    if run_gridsearch:
-        assert reducer_param_grid is not None
-        assert model_param_grid is not None
-
-        gridsearchcv = GridSearchCV(
-            estimator=pipeline,
-            param_grid=(reducer_param_grid | model_param_grid), # Union of two dictionaries
-            cv=gridsearch_cv_folds,
-            scoring=pear_scorer,
-            verbose=3,
-            refit=True
-        )
-        gridsearchcv.fit(X_train, y_train)
-    
-        result_path = result_path if result_path is not None else f"{model_name}_{reducer_name}_gridsearch.csv"
-        pd.DataFrame(gridsearchcv.cv_results_).to_csv(result_path, index=False)
-    
-        return gridsearchcv.best_estimator_
-    
-    else:
-        pipeline.fit(X_train, y_train)
-        return pipeline
+            search_class = GridSearchCV if n_jobs == 1 else partial(ProcessGridSearchCV, n_jobs=n_jobs)
+            gridsearchcv = search_class(
+                estimator=pipeline,
+                param_grid=(reducer_param_grid | model_param_grid), # Union of two dictionaries
+                cv=gridsearch_cv_folds,
+                scoring=pear_scorer,
+                verbose=3,
+                refit=True
+            )
+            gridsearchcv.fit(X_train, y_train)
+        
+            result_path = result_path if result_path is not None else f"{model_name}_{reducer_name}_gridsearch.csv"
+            pd.DataFrame(gridsearchcv.cv_results_).to_csv(result_path, index=False)
+
+            best_estimator = gridsearchcv.best_estimator_
+            if tmp_dir is not None:
+                best_estimator.set_params(memory=None) # The temporary cache is removed below
+            return best_estimator
+        
+        else:
+            pipeline.fit(X_train, y_train)
+            return pipeline
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        elif memory is not None:
+            memory.reduce_size(bytes_limit=cache_size_limit)
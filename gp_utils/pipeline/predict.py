@@ -0,0 +1,85 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from preprocessing import is_genotype_matrix
+# from ..preprocessing import is_genotype_matrix
+
+#############################
+### Chunked batch scoring ###
+#############################
+def predict_batches(pipeline, source, batch_size: int = 1024, n_jobs: int = 1, out=None):
+    '''
+    Predict a large candidate set with a fitted pipeline, batch_size samples at a time on n_jobs threads.
+
+    Every batch goes through the whole pipeline (conversion, imputation, scaling, model) on its own, so
+    memory is bounded by the 2 * n_jobs batches in flight rather than by the size of the candidate set.
+    Threads share the fitted pipeline without copies; BLAS products and most numpy/pandas kernels
+    release the GIL, so throughput grows with n_jobs (set BLAS to one thread per worker for best scaling).
+
+    Parameters
+    ----------
+    pipeline: fitted pipeline or estimator with a single-trait predict method.
+    source: genotypes of the candidates, either sliceable with a length (pandas dataframe, numpy array
+            or memory map, GenotypeMatrix), cut into batches of batch_size rows, or an iterable of batches
+            (e.g. pd.read_csv(..., chunksize=batch_size) or simCross outputs).
+    n_jobs: number of threads, -1 uses all cores.
+    out: None to yield the predictions of every batch, in order.
+         A numpy array (or memory map) of shape (n_samples,) to fill, for sliceable sources.
+         A path: ".npy" files are written as memory maps (sliceable sources only); other paths are written
+         as CSV with columns sample (dataframe index, or position) and y_pred, one batch at a time.
+
+    Return:
+    -------
+    Generator of 1-D prediction arrays if out is None, out (array or path) otherwise.
+    '''
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    batches = _iter_batches(source, batch_size)
+    if out is None:
+        return (pred for _, pred in _iter_predictions(pipeline, batches, n_jobs))
+
+    if isinstance(out, (str, os.PathLike)) and not str(out).endswith(".npy"):
+        header, start = True, 0
+        for batch, pred in _iter_predictions(pipeline, batches, n_jobs):
+            index = batch.index if isinstance(batch, pd.DataFrame) else np.arange(start, start + len(pred))
+            pd.DataFrame({"sample": index, "y_pred": pred}).to_csv(out, mode="w" if header else "a", index=False, header=header)
+            header, start = False, start + len(pred)
+        return out
+
+    if not hasattr(source, "__len__"):
+        raise ValueError("Arrays and .npy outputs need a sliceable source with a length.")
+    target = np.lib.format.open_memmap(out, mode="w+", dtype=np.float64, shape=(len(source),)) if isinstance(out, (str, os.PathLike)) else out
+    if len(target) != len(source):
+        raise ValueError(f"out must have one entry per sample ({len(source)}).")
+    start = 0
+    for _, pred in _iter_predictions(pipeline, batches, n_jobs):
+        target[start:start + len(pred)] = pred
+        start += len(pred)
+    if isinstance(target, np.memmap):
+        target.flush()
+    return out
+
+### Internal utilities ###
+def _iter_batches(source, batch_size):
+    if isinstance(source, pd.DataFrame):
+        return (source.iloc[start:start + batch_size] for start in range(0, len(source), batch_size))
+    if isinstance(source, np.ndarray) or is_genotype_matrix(source):
+        return (source[start:start + batch_size] for start in range(0, len(source), batch_size))
+    return iter(source)
+
+
+def _iter_predictions(pipeline, batches, n_jobs):
+    '''Yield (batch, predictions) in order, keeping at most 2 * n_jobs batches submitted at once.'''
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append((batch, executor.submit(pipeline.predict, batch)))
+            if len(pending) >= 2 * n_jobs:
+                batch, future = pending.popleft()
+                yield batch, np.asarray(future.result()).ravel()
+        while pending:
+            batch, future = pending.popleft()
+            yield batch, np.asarray(future.result()).ravel()
@@ -0,0 +1,223 @@
+import os
+import time
+import shutil
+import tempfile
+import warnings
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+
+from sklearn.base import clone
+from sklearn.metrics import check_scoring
+from sklearn.model_selection import ParameterGrid, check_cv
+from sklearn.utils import _safe_indexing
+
+from utils import get_backend
+# from ..utils import get_backend
+
+####################################
+### Process-pool parallel search ###
+####################################
+_WORKER_STATE = {} # Per-process training data, estimator and scorer, set once by _init_worker.
+_LABELS_SUFFIX = ".labels.pkl" # Index and columns of a dataframe or series shared as .npy values
+
+
+class ProcessGridSearchCV:
+    '''
+    Exhaustive grid search over (candidate, fold) tasks on a pool of spawn-based worker processes.
+
+    Every worker starts its own R session once and loads the training data once: numpy arrays are
+    memory-mapped from a temporary .npy file, and so are the values of single-dtype dataframes and series,
+    which workers wrap back with their index and columns. Other inputs are read from a temporary pickle.
+    Tasks only carry the candidate parameters and fold indices. Unlike threads, workers do not
+    serialize on one embedded R interpreter, and unlike forked workers they do not inherit R state.
+
+    cv_results_, best_index_, best_params_, best_score_ and best_estimator_ follow GridSearchCV.
+
+    Parameters
+    ----------
+    estimator: estimator or pipeline to tune. Must be picklable.
+    param_grid: dict or list of dicts, as in GridSearchCV.
+    scoring: scorer or metric name, as in GridSearchCV.
+    cv: number of folds or cross-validation splitter.
+    n_jobs: number of worker processes, -1 uses all cores.
+    refit: refit the best candidate on the whole training data in the calling process.
+    start_r: start R in every worker before the first task. Workers run without R if it is not available.
+    error_score: score of failed fits, or "raise".
+    '''
+    def __init__(self, estimator, param_grid, scoring=None, cv=5, n_jobs=-1, refit=True, verbose=0, start_r=True, error_score=np.nan):
+        self.estimator = estimator
+        self.param_grid = param_grid
+        self.scoring = scoring
+        self.cv = cv
+        self.n_jobs = n_jobs
+        self.refit = refit
+        self.verbose = verbose
+        self.start_r = start_r
+        self.error_score = error_score
+
+    def fit(self, X, y):
+        '''
+        X: numpy array or pandas dataframe
+        y: numpy array or pandas series
+        '''
+        candidates = list(ParameterGrid(self.param_grid))
+        splits = list(check_cv(self.cv, y).split(X, y))
+        tasks = [(c, s, candidates[c], train, test) for c in range(len(candidates)) for s, (train, test) in enumerate(splits)]
+        scorer = check_scoring(self.estimator, scoring=self.scoring)
+        n_jobs = os.cpu_count() if self.n_jobs == -1 else self.n_jobs
+
+        data_dir = tempfile.mkdtemp(prefix="gp_utils_search_")
+        try:
+            data_paths = _share_data(X, y, data_dir)
+            settings = {"estimator": self.estimator, "scorer": scorer, "start_r": self.start_r, "error_score": self.error_score}
+            with ProcessPoolExecutor(max_workers=min(n_jobs, len(tasks)), mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_init_worker, initargs=(data_paths, settings)) as executor:
+                results = []
+                for task, result in zip(tasks, executor.map(_run_task, tasks)):
+                    results.append(result)
+                    if self.verbose > 0:
+                        print(f"[CV {task[1] + 1}/{len(splits)}] {task[2]}; score={result['test_score']:.3f}, fit time={result['fit_time']:.1f}s")
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+        self._check_failures(results)
+        self.cv_results_ = self._format_results(candidates, len(splits), results)
+        self.n_splits_ = len(splits)
+        self.best_index_ = int(np.argmin(self.cv_results_["rank_test_score"]))
+        self.best_params_ = candidates[self.best_index_]
+        self.best_score_ = self.cv_results_["mean_test_score"][self.best_index_]
+        if self.refit:
+            start = time.perf_counter()
+            self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_).fit(X, y)
+            self.refit_time_ = time.perf_counter() - start
+        return self
+
+    def predict(self, X):
+        return self.best_estimator_.predict(X)
+
+    def score(self, X, y):
+        return check_scoring(self.estimator, scoring=self.scoring)(self.best_estimator_, X, y)
+
+    ### Internal utilities ###
+    def _check_failures(self, results):
+        errors = [result["error"] for result in results if result["error"] is not None]
+        if not errors:
+            return
+        if len(errors) == len(results):
+            raise ValueError(f"All the {len(results)} fits failed. First error:\n{errors[0]}")
+        warnings.warn(f"{len(errors)} of the {len(results)} fits failed. First error:\n{errors[0]}", UserWarning)
+
+    def _format_results(self, candidates, n_splits, results):
+        '''cv_results_ in the GridSearchCV layout, results being ordered by candidate then fold.'''
+        n_candidates = len(candidates)
+        res = {}
+        for key in ("fit_time", "score_time"):
+            values = np.array([result[key] for result in results]).reshape(n_candidates, n_splits)
+            res[f"mean_{key}"] = values.mean(axis=1)
+            res[f"std_{key}"] = values.std(axis=1)
+
+        param_names = sorted({name for params in candidates for name in params})
+        for name in param_names:
+            column = np.ma.MaskedArray(np.empty(n_candidates, dtype=object), mask=True)
+            for i, params in enumerate(candidates):
+                if name in params:
+                    column[i] = params[name]
+            res[f"param_{name}"] = column
+        res["params"] = candidates
+
+        scores = np.array([result["test_score"] for result in results], dtype=float).reshape(n_candidates, n_splits)
+        for s in range(n_splits):
+            res[f"split{s}_test_score"] = scores[:, s]
+        res["mean_test_score"] = scores.mean(axis=1)
+        res["std_test_score"] = scores.std(axis=1)
+        # Candidates with failed fits (nan mean) are ranked last, as in GridSearchCV
+        mean = np.where(np.isnan(res["mean_test_score"]), -np.inf, res["mean_test_score"])
+        res["rank_test_score"] = rankdata(-mean, method="min").astype(np.int32)
+        return res
+
+
+def _share_data(X, y, data_dir):
+    '''
+    Write the training data once for all workers (read back by _load_shared). numpy arrays and the values
+    of numeric single-dtype dataframes and series are written as .npy, their index and columns as a small
+    pickle next to them. Other inputs (e.g. mixed-dtype dataframes) are pickled whole.
+    '''
+    paths = {}
+    for name, data in (("X", X), ("y", y)):
+        values = _numeric_values(data)
+        if values is None:
+            paths[name] = os.path.join(data_dir, f"{name}.pkl")
+            pd.to_pickle(data, paths[name])
+            continue
+        paths[name] = os.path.join(data_dir, f"{name}.npy")
+        np.save(paths[name], values)
+        if isinstance(data, pd.DataFrame):
+            pd.to_pickle({"index": data.index, "columns": data.columns}, paths[name] + _LABELS_SUFFIX)
+        elif isinstance(data, pd.Series):
+            pd.to_pickle({"index": data.index, "name": data.name}, paths[name] + _LABELS_SUFFIX)
+    return paths
+
+
+def _load_shared(path, mmap_mode="r"):
+    '''Read data written by _share_data. Dataframes and series are rebuilt around the (memory-mapped) values, without a copy.'''
+    if not path.endswith(".npy"):
+        return pd.read_pickle(path)
+    values = np.load(path, mmap_mode=mmap_mode)
+    if not os.path.exists(path + _LABELS_SUFFIX):
+        return values
+    labels = pd.read_pickle(path + _LABELS_SUFFIX)
+    if "columns" in labels:
+        return pd.DataFrame(values, index=labels["index"], columns=labels["columns"], copy=False)
+    return pd.Series(values, index=labels["index"], name=labels["name"], copy=False)
+
+
+def _numeric_values(data):
+    '''Values of a numpy array, or of a dataframe or series with a single numeric numpy dtype; None otherwise.'''
+    if isinstance(data, np.ndarray):
+        return data
+    if isinstance(data, pd.Series):
+        dtypes = {data.dtype}
+    elif isinstance(data, pd.DataFrame) and data.shape[1] > 0:
+        dtypes = set(data.dtypes)
+    else:
+        return None
+    dtype = dtypes.pop()
+    if dtypes or not isinstance(dtype, np.dtype) or dtype.kind not in "biuf":
+        return None
+    return data.to_numpy()
+
+
+def _init_worker(data_paths, settings):
+    _WORKER_STATE.clear()
+    _WORKER_STATE.update(settings)
+    for name, path in data_paths.items():
+        _WORKER_STATE[name] = _load_shared(path)
+    if settings["start_r"]:
+        try:
+            get_backend("R")
+        except (EnvironmentError, ImportError):
+            pass # Models without an R backend still run; R models raise on first use
+
+
+def _run_task(task):
+    _, _, params, train, test = task
+    X, y = _WORKER_STATE["X"], _WORKER_STATE["y"]
+    result = {"fit_time": 0.0, "score_time": 0.0, "test_score": _WORKER_STATE["error_score"], "error": None}
+    start = time.perf_counter()
+    try:
+        estimator = clone(_WORKER_STATE["estimator"]).set_params(**params)
+        estimator.fit(_safe_indexing(X, train), _safe_indexing(y, train))
+        result["fit_time"] = time.perf_counter() - start
+        start = time.perf_counter()
+        result["test_score"] = _WORKER_STATE["scorer"](estimator, _safe_indexing(X, test), _safe_indexing(y, test))
+        result["score_time"] = time.perf_counter() - start
+    except Exception:
+        if _WORKER_STATE["error_score"] == "raise":
+            raise
+        result["error"] = traceback.format_exc()
+    return result
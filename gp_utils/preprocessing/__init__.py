@@ -1,5 +1,16 @@
 from .str2num import str2numConverter
+from .maporder import MapOrderTransformer
+from .streaming import read_genotypes
+from .genotype_matrix import GenotypeMatrix, is_genotype_matrix
+from .genotype_preprocessor import GenotypePreprocessor
+from .dropconstant import DropConstantMarkers
 
 __all__ = [
-    "str2numConverter"
+    "str2numConverter",
+    "MapOrderTransformer",
+    "read_genotypes",
+    "GenotypeMatrix",
+    "is_genotype_matrix",
+    "GenotypePreprocessor",
+    "DropConstantMarkers"
 ]
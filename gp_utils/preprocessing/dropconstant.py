@@ -0,0 +1,38 @@
+import numpy as np
+from feature_engine.selection import DropConstantFeatures
+
+from .genotype_matrix import is_genotype_matrix
+
+
+class DropConstantMarkers(DropConstantFeatures):
+    '''
+    DropConstantFeatures (missing values ignored) that also accepts a GenotypeMatrix.
+    Constant markers of a packed matrix are found from its genotype counts, without decoding,
+    and dropped by selecting packed rows. All-missing markers are kept, as for dataframes
+    (SimpleImputer drops them). Dataframes go through DropConstantFeatures unchanged.
+    '''
+    def __init__(self, variables=None, missing_values="ignore", tol=1, confirm_variables=False):
+        super().__init__(variables=variables, missing_values=missing_values, tol=tol, confirm_variables=confirm_variables)
+
+    def fit(self, X, y=None):
+        if not is_genotype_matrix(X):
+            self.support_ = None
+            return super().fit(X, y)
+        if self.variables is not None or self.tol != 1 or self.missing_values != "ignore":
+            raise ValueError("A GenotypeMatrix only supports variables=None, tol=1 and missing_values='ignore'.")
+        n_distinct = (X.value_counts()[:, :3] > 0).sum(axis=1)
+        self.support_ = n_distinct != 1
+        if not self.support_.any():
+            raise ValueError("The resulting data will have no markers after dropping all constant markers.")
+        self.variables_ = X.markers.tolist()
+        self.features_to_drop_ = X.markers[~self.support_].tolist()
+        self.feature_names_in_ = self.variables_
+        self.n_features_in_ = len(self.variables_)
+        return self
+
+    def transform(self, X):
+        if not is_genotype_matrix(X):
+            return super().transform(X)
+        if getattr(self, "support_", None) is None or X.markers.tolist() != self.feature_names_in_:
+            raise ValueError("Input X markers do not match with training data.")
+        return X[:, np.flatnonzero(self.support_)]
@@ -0,0 +1,235 @@
+import numpy as np
+import pandas as pd
+
+##################################
+### 2-bit packed genotype data ###
+##################################
+MISSING_CODE = -128 # Missing genotypes in integer outputs (NaN in float outputs)
+BITS_SUFFIX = ".bits.npy"
+SAMPLES_SUFFIX = ".samples.txt"
+MARKERS_SUFFIX = ".markers.txt"
+
+# 2-bit codes, as in PLINK .bed: 00 = 1 (homozygous reference), 01 = missing, 10 = 0 (heterozygous), 11 = -1
+_CODE_VALUES = np.array([1, MISSING_CODE, 0, -1], dtype=np.int8)
+_VALUE_CODES = np.full(256, 0b01, dtype=np.uint8) # int8 value (viewed as uint8) -> 2-bit code, missing otherwise
+_VALUE_CODES[np.array([1, 0, -1], dtype=np.int8).view(np.uint8)] = [0b00, 0b10, 0b11]
+# Byte -> 4 decoded genotypes (first sample in the low bits)
+_BYTE_CODES = (np.arange(256, dtype=np.uint8)[:, np.newaxis] >> np.array([0, 2, 4, 6], dtype=np.uint8)) & 0b11
+_DECODE_INT8 = _CODE_VALUES[_BYTE_CODES]
+_DECODE_FLOAT32 = np.where(_DECODE_INT8 == MISSING_CODE, np.nan, _DECODE_INT8).astype(np.float32)
+
+
+class GenotypeMatrix:
+    '''
+    Genotype matrix {-1, 0, 1} (samples x markers) stored with 2 bits per genotype, marker-major:
+    row j of the packed array holds marker j for all samples, 4 samples per byte (like PLINK .bed).
+
+    On disk, a matrix is three files sharing a prefix: the packed array (prefix + ".bits.npy",
+    memory-mapped on load) and one name per line in prefix + ".samples.txt" and prefix + ".markers.txt".
+
+    Genotypes are decoded lazily, one block of markers at a time, to int8 (missing = MISSING_CODE)
+    or float32 (missing = NaN). Indexing returns a new GenotypeMatrix: selecting markers only
+    selects packed rows, selecting samples repacks them. Models and reducers need complete
+    matrices (see check_complete): impute missing genotypes with GenotypePreprocessor first.
+
+    Parameters
+    ----------
+    bits: uint8 array of shape (n_markers, ceil(n_samples / 4)).
+    samples, markers: sample and marker names.
+    block_size: number of markers decoded at once.
+    '''
+    _packed_genotypes = True # Interface marker, see is_genotype_matrix
+
+    def __init__(self, bits, samples, markers, block_size=4096):
+        self.bits = bits
+        self.samples = pd.Index(samples)
+        self.markers = pd.Index(markers)
+        self.block_size = block_size
+        if bits.shape != (len(self.markers), _n_bytes(len(self.samples))):
+            raise ValueError("Packed array shape does not match the numbers of samples and markers.")
+
+    ### Construction and storage ###
+    @classmethod
+    def from_array(cls, X, samples=None, markers=None, prefix=None, block_size=4096):
+        '''
+        Pack a genotype matrix {-1, 0, 1} (numpy array, memory map or pandas dataframe), one block of markers at a time.
+        Missing values are NaN or MISSING_CODE. Names default to the dataframe index and columns, or to positions.
+        With prefix, the packed array is written to disk as it is built and the saved matrix is returned.
+        '''
+        if isinstance(X, pd.DataFrame):
+            samples = X.index if samples is None else samples
+            markers = X.columns if markers is None else markers
+            X = X.to_numpy()
+        n, p = X.shape
+        samples = np.arange(n) if samples is None else samples
+        markers = np.arange(p) if markers is None else markers
+        shape = (p, _n_bytes(n))
+        if prefix is None:
+            bits = np.empty(shape, dtype=np.uint8)
+        else:
+            bits = np.lib.format.open_memmap(prefix + BITS_SUFFIX, mode="w+", dtype=np.uint8, shape=shape)
+        for start in range(0, p, block_size):
+            bits[start:start + block_size] = _pack(X[:, start:start + block_size])
+        G = cls(bits, samples, markers, block_size=block_size)
+        if prefix is not None:
+            bits.flush()
+            G._write_names(prefix)
+        return G
+
+    @classmethod
+    def load(cls, prefix, block_size=4096):
+        '''Open a saved matrix. The packed array is memory-mapped, not read.'''
+        bits = np.load(prefix + BITS_SUFFIX, mmap_mode="r")
+        samples = pd.read_csv(prefix + SAMPLES_SUFFIX, header=None, dtype=str).iloc[:, 0]
+        markers = pd.read_csv(prefix + MARKERS_SUFFIX, header=None, dtype=str).iloc[:, 0]
+        return cls(bits, samples, markers, block_size=block_size)
+
+    def save(self, prefix):
+        np.save(prefix + BITS_SUFFIX, self.bits)
+        self._write_names(prefix)
+
+    ### Array interface ###
+    @property
+    def shape(self):
+        return (len(self.samples), len(self.markers))
+
+    @property
+    def ndim(self):
+        return 2
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, key):
+        '''G[rows] or G[rows, markers] with slices, integer or boolean arrays.'''
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+        if not isinstance(cols, slice):
+            cols = np.arange(self.shape[1])[cols]
+        sub = GenotypeMatrix(self.bits[cols], self.samples, self.markers[cols], block_size=self.block_size) # Slices stay views
+        if isinstance(rows, slice) and rows == slice(None):
+            return sub
+        rows = np.arange(self.shape[0])[rows]
+        packed = np.empty((sub.shape[1], _n_bytes(rows.size)), dtype=np.uint8)
+        for start, block in sub.iter_blocks(dtype=np.int8):
+            packed[start:start + block.shape[1]] = _pack(block[rows])
+        return GenotypeMatrix(packed, self.samples[rows], sub.markers, block_size=self.block_size)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.to_numpy(dtype=np.float32 if dtype is None else dtype)
+
+    @property
+    def values(self):
+        '''Fully decoded float32 matrix (missing = NaN).'''
+        return self.to_numpy(dtype=np.float32)
+
+    def __matmul__(self, other):
+        return self.dot(other)
+
+    ### Decoding ###
+    def decode(self, cols=slice(None), dtype=np.int8):
+        '''
+        Decode the markers cols (slice or integer array) for all samples.
+        dtype: np.int8 (missing = MISSING_CODE) or a float dtype (missing = NaN).
+        '''
+        lut = _DECODE_INT8 if np.dtype(dtype) == np.int8 else _DECODE_FLOAT32
+        bits = np.asarray(self.bits[cols])
+        decoded = lut[bits].reshape(bits.shape[0], -1)[:, :self.shape[0]]
+        return np.ascontiguousarray(decoded.T).astype(dtype, copy=False)
+
+    def iter_blocks(self, dtype=np.float32, block_size=None):
+        '''Yield (first marker position, decoded block of shape (n_samples, block_size)).'''
+        block_size = self.block_size if block_size is None else block_size
+        for start in range(0, self.shape[1], block_size):
+            yield start, self.decode(slice(start, start + block_size), dtype=dtype)
+
+    def to_numpy(self, dtype=np.float32):
+        out = np.empty(self.shape, dtype=dtype)
+        for start, block in self.iter_blocks(dtype=dtype):
+            out[:, start:start + block.shape[1]] = block
+        return out
+
+    ### Blockwise linear algebra ###
+    def dot(self, w):
+        '''X @ w for w of shape (n_markers,) or (n_markers, k), decoding one block of markers at a time.'''
+        w = np.asarray(w)
+        out = np.zeros((self.shape[0],) + w.shape[1:], dtype=np.result_type(w.dtype, np.float32))
+        for start, block in self.iter_blocks(dtype=np.float32):
+            out += block @ w[start:start + block.shape[1]]
+        return out
+
+    def tdot(self, v):
+        '''X.T @ v for v of shape (n_samples,) or (n_samples, k).'''
+        v = np.asarray(v)
+        out = np.empty((self.shape[1],) + v.shape[1:], dtype=np.result_type(v.dtype, np.float32))
+        for start, block in self.iter_blocks(dtype=np.float32):
+            out[start:start + block.shape[1]] = block.T @ v
+        return out
+
+    def value_counts(self):
+        '''Per-marker counts of -1, 0, 1 and missing genotypes, shape (n_markers, 4), without decoding to float.'''
+        counts = np.zeros((self.shape[1], 4), dtype=np.int64)
+        for start in range(0, self.shape[1], self.block_size):
+            codes = _BYTE_CODES[np.asarray(self.bits[start:start + self.block_size])].reshape(-1, _n_bytes(self.shape[0]) * 4)
+            codes = codes[:, :self.shape[0]]
+            for column, code in enumerate([0b11, 0b10, 0b00, 0b01]):
+                counts[start:start + codes.shape[0], column] = np.count_nonzero(codes == code, axis=1)
+        return counts
+
+    def column_stats(self):
+        '''
+        Per-marker (mean, variance, number of missing values), ignoring missing values.
+        Computed from genotype counts, without decoding to float.
+        '''
+        counts = self.value_counts()
+        n_obs = counts[:, :3].sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = (counts[:, 2] - counts[:, 0]) / n_obs
+            var = (counts[:, 2] + counts[:, 0]) / n_obs - mean ** 2
+        return mean, var, counts[:, 3]
+
+    def check_complete(self):
+        '''
+        Raise a ValueError if any genotype is missing. Missing genotypes decode to NaN, which models
+        and reducers would propagate; impute them first (GenotypePreprocessor, or init_pipeline).
+        '''
+        n_missing = self.value_counts()[:, 3]
+        if n_missing.any():
+            raise ValueError(
+                f"{np.count_nonzero(n_missing)} markers of the GenotypeMatrix have missing genotypes. "
+                "Impute them first, e.g. with GenotypePreprocessor or an init_pipeline pipeline."
+            )
+        return self
+
+    ### Internal utilities ###
+    def _write_names(self, prefix):
+        pd.Series(self.samples).to_csv(prefix + SAMPLES_SUFFIX, index=False, header=False)
+        pd.Series(self.markers).to_csv(prefix + MARKERS_SUFFIX, index=False, header=False)
+
+
+def is_genotype_matrix(X):
+    '''
+    True if X is a GenotypeMatrix. Checked on a class marker rather than with isinstance:
+    gp_utils.preprocessing and the top-level preprocessing module (sibling imports) hold distinct
+    GenotypeMatrix classes, and a matrix built through either must be recognised by both.
+    '''
+    return getattr(type(X), "_packed_genotypes", False) is True
+
+
+def _n_bytes(n_samples):
+    return (n_samples + 3) // 4
+
+
+def _pack(X):
+    '''Packed marker-major bytes of a genotype block X (n_samples, n_markers).'''
+    X = np.asarray(X)
+    if np.issubdtype(X.dtype, np.floating):
+        X = np.where(np.isnan(X), MISSING_CODE, X)
+    if ((X != MISSING_CODE) & ((X < -1) | (X > 1))).any():
+        raise ValueError("Genotypes must be encoded as {-1, 0, 1} (see str2numConverter).")
+    X = X.astype(np.int8, copy=False)
+    codes = _VALUE_CODES[X.T.view(np.uint8)]
+    pad = (-codes.shape[1]) % 4
+    if pad:
+        codes = np.pad(codes, ((0, 0), (0, pad)), constant_values=0b01)
+    codes = codes.reshape(codes.shape[0], -1, 4)
+    return codes[:, :, 0] | (codes[:, :, 1] << 2) | (codes[:, :, 2] << 4) | (codes[:, :, 3] << 6)
@@ -0,0 +1,213 @@
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+
+from .genotype_matrix import MISSING_CODE, is_genotype_matrix
+from .str2num import str2numConverter, ALLELE_PAIRS, _iter_codes, _add_code_counts, _reference_alleles, _BLOCK_VALUES
+from .streaming import _lookup
+
+IMPUTATION_STRATEGIES = ["mean", "median", "most_frequent", "constant"]
+_GENOTYPES = np.array([-1.0, 0.0, 1.0])
+# int8 genotype (viewed as uint8) -> column of the per-marker tables: -1, 0, 1, missing, 4 for invalid values
+_CODE_INDEX = np.full(256, 4, dtype=np.int64)
+_CODE_INDEX[np.array([-1, 0, 1, MISSING_CODE], dtype=np.int8).view(np.uint8)] = [0, 1, 2, 3]
+
+
+class GenotypePreprocessor(BaseEstimator, TransformerMixin):
+    '''
+    Drop constant markers, encode, impute and standardize genotypes in one step. Replaces the
+    DropConstantFeatures -> str2numConverter -> SimpleImputer -> StandardScaler prefix of init_pipeline,
+    which allocates a new full-size float64 matrix at every step.
+
+    Genotypes are encoded once to int8 {-1, 0, 1} (see str2numConverter). The counts of -1, 0, 1 and
+    missing values of each marker give all fitted statistics: constant markers, the imputed value, and
+    the mean and standard deviation after imputation. transform maps each marker through a lookup table
+    (-1, 0, 1, missing -> standardized value), filling a single output array block by block.
+
+    Outputs match the four-step prefix up to rounding. Constant and all-missing markers are dropped,
+    constant markers being found on encoded genotypes.
+
+    Parameters
+    ----------
+    imputation_strategy, fill_value: as in SimpleImputer.
+    dtype: output dtype, np.float64 or np.float32.
+
+    X may be a pandas dataframe in any encoding supported by str2numConverter, a numpy array {-1, 0, 1}
+    (missing values NaN, or MISSING_CODE for int8 arrays) or a GenotypeMatrix.
+    '''
+    def __init__(self, imputation_strategy="mean", fill_value=None, dtype=np.float64):
+        self.imputation_strategy = imputation_strategy
+        self.fill_value = fill_value
+        self.dtype = dtype
+
+    def fit(self, X, y=None):
+        self._fit(X)
+        return self
+
+    def fit_transform(self, X, y=None):
+        codes = self._fit(X)
+        if codes is None:
+            return self.transform(X)
+        return self._gather(codes[:, self.support_[self.encoded_]]) # Encoded dataframes are not encoded again
+
+    def transform(self, X):
+        if not hasattr(self, "lut_"):
+            raise RuntimeError("You must fit the preprocessor before transforming data.")
+        if is_genotype_matrix(X):
+            if X.markers.tolist() != self.columns_:
+                raise ValueError("Input X markers do not match with training data.")
+            return self._gather(X[:, self.support_])
+        if isinstance(X, pd.DataFrame):
+            if X.columns.tolist() != self.columns_:
+                raise ValueError("Input X columns do not match with training data.")
+            if self.converter_ is None:
+                raise TypeError("The preprocessor was fitted on encoded genotypes: X must be a numpy array or a GenotypeMatrix.")
+            return self._gather(self.converter_.transform(X.iloc[:, self.support_]))
+        return self._gather(X, columns=np.flatnonzero(self.support_))
+
+    def get_feature_names_out(self, input_features=None):
+        '''Marker names of the kept columns, so set_output(transform="pandas") can label them.'''
+        return np.asarray(self.columns_, dtype=object)[self.support_]
+
+    ### Internal utilities ###
+    def _fit(self, X):
+        '''
+        Fit all statistics from genotype counts.
+        Return the int8 codes of the encoded columns (self.encoded_) of dataframes, None for other inputs.
+        '''
+        if self.imputation_strategy not in IMPUTATION_STRATEGIES:
+            raise ValueError(f"Unsupported imputation strategy: {self.imputation_strategy}")
+        codes = None
+        if is_genotype_matrix(X):
+            self.columns_ = X.markers.tolist()
+            self.encoded_ = np.ones(len(self.columns_), dtype=bool)
+            self.converter_ = None
+        elif isinstance(X, pd.DataFrame):
+            self.columns_ = X.columns.tolist()
+            codes = self._encode(X)
+        elif isinstance(X, np.ndarray):
+            self.columns_ = list(range(X.shape[1]))
+            self.encoded_ = np.ones(X.shape[1], dtype=bool)
+            self.converter_ = None
+        else:
+            raise TypeError("Input X must be a pandas DataFrame, a numpy array or a GenotypeMatrix.")
+
+        encoded_columns = np.flatnonzero(self.encoded_)
+        counts = np.zeros((encoded_columns.size, 5), dtype=np.int64) # -1, 0, 1, missing, invalid
+        for (rows, cols), block in _iter_code_blocks(X if codes is None else codes):
+            _add_code_counts(counts[cols], _code_index(block))
+
+        n_distinct = (counts[:, :3] > 0).sum(axis=1)
+        keep = n_distinct >= 2 # All-missing markers are dropped too, as SimpleImputer does
+        if not keep.any():
+            raise ValueError("The resulting data will have no markers after dropping all constant markers.")
+        self.support_ = np.zeros(len(self.columns_), dtype=bool)
+        self.support_[encoded_columns[keep]] = True
+        if self.converter_ is not None:
+            _restrict_converter(self.converter_, keep)
+
+        counts = counts[keep, :4].astype(np.float64)
+        self.statistics_ = self._imputed_values(counts[:, :3])
+        values = np.column_stack((np.broadcast_to(_GENOTYPES, (counts.shape[0], 3)), self.statistics_))
+        self.mean_ = (counts * values).sum(axis=1) / counts.sum(axis=1)
+        var = (counts * (values - self.mean_[:, np.newaxis]) ** 2).sum(axis=1) / counts.sum(axis=1)
+        self.scale_ = np.where(var > 0, np.sqrt(var), 1.0) # As StandardScaler for constant columns
+        self.lut_ = ((values - self.mean_[:, np.newaxis]) / self.scale_[:, np.newaxis]).astype(self.dtype)
+        return codes
+
+    def _encode(self, X):
+        '''
+        Fit self.converter_ (int8 str2numConverter) and return the int8 codes of the dataframe columns
+        to encode (self.encoded_). Unlabeled allele calls need both alleles of a marker to encode it, so
+        markers showing a single allele pair (monomorphic, thus constant) are left out. Their strings are
+        factorized once: allele-pair codes are kept as int8 and mapped once reference alleles are known.
+        '''
+        self.converter_ = str2numConverter(dtype=np.int8)
+        self.encoded_ = np.ones(X.shape[1], dtype=bool)
+        encoding_type = str2numConverter(read_only=True).fit(X).encoding_type_
+        if encoding_type != "allele_call_unlabeled":
+            return self.converter_.fit(X).transform(X)
+
+        pair_codes = np.empty(X.shape, dtype=np.int8)
+        pair_counts = np.zeros((X.shape[1], len(ALLELE_PAIRS) + 1), dtype=np.int64)
+        for cols, block in _iter_codes(X, ALLELE_PAIRS):
+            _add_code_counts(pair_counts[cols], block)
+            pair_codes[:, cols] = block
+        self.encoded_ = (pair_counts[:, :-1] > 0).sum(axis=1) >= 2
+        self.converter_.encoding_type_ = encoding_type
+        self.converter_.columns_ = X.columns[self.encoded_].tolist()
+        self.converter_.reference_alleles_ = _reference_alleles(pair_counts[self.encoded_], self.converter_.columns_)
+        self.converter_.lut_ = self.converter_._allele_call_lut()
+
+        pair_codes = pair_codes[:, self.encoded_]
+        codes = np.empty(pair_codes.shape, dtype=np.int8)
+        block_rows = max(1, _BLOCK_VALUES // max(1, codes.shape[1]))
+        for start in range(0, codes.shape[0], block_rows):
+            rows = slice(start, start + block_rows)
+            codes[rows] = _lookup(pair_codes[rows].astype(np.int64), self.converter_.lut_, self.converter_.columns_)
+        return codes
+
+    def _imputed_values(self, counts):
+        '''Per-marker imputed value from the counts of -1, 0 and 1, as SimpleImputer.'''
+        if self.imputation_strategy == "constant":
+            return np.full(counts.shape[0], 0.0 if self.fill_value is None else float(self.fill_value))
+        n_obs = counts.sum(axis=1)
+        if self.imputation_strategy == "mean":
+            return (counts[:, 2] - counts[:, 0]) / n_obs
+        if self.imputation_strategy == "most_frequent":
+            return _GENOTYPES[np.argmax(counts, axis=1)] # Ties go to the smallest value
+        # Median: mean of the sorted values at positions floor((n - 1) / 2) and floor(n / 2)
+        cumulative = np.cumsum(counts, axis=1)
+        lower = _GENOTYPES[(cumulative <= ((n_obs - 1) // 2)[:, np.newaxis]).sum(axis=1)]
+        upper = _GENOTYPES[(cumulative <= (n_obs // 2)[:, np.newaxis]).sum(axis=1)]
+        return (lower + upper) / 2
+
+    def _gather(self, X, columns=None):
+        '''Standardized genotypes of the kept markers, written into one output array through lut_.'''
+        out = np.empty((X.shape[0], self.lut_.shape[0]), dtype=self.dtype)
+        flat_lut = self.lut_.ravel()
+        for (rows, cols), block in _iter_code_blocks(X, columns=columns):
+            offsets = np.arange(self.lut_.shape[0])[cols] * self.lut_.shape[1]
+            np.take(flat_lut, _code_index(block) + offsets, out=out[rows, cols])
+        return out
+
+
+def _iter_code_blocks(X, columns=None):
+    '''
+    Yield ((rows, cols) of the output, int8 block) over a GenotypeMatrix (blocks of markers)
+    or a numpy array (blocks of rows), restricted to the given column positions.
+    '''
+    if is_genotype_matrix(X):
+        X = X if columns is None else X[:, columns]
+        for start, block in X.iter_blocks(dtype=np.int8):
+            yield (slice(None), slice(start, start + block.shape[1])), block
+        return
+    block_rows = max(1, _BLOCK_VALUES // max(1, X.shape[1])) # Bounds the int64 table indices of a block
+    for start in range(0, X.shape[0], block_rows):
+        block = X[start:start + block_rows] if columns is None else X[start:start + block_rows, columns]
+        yield (slice(start, start + block_rows), slice(None)), _int8_codes(block)
+
+
+def _int8_codes(block):
+    block = np.asarray(block)
+    if block.dtype == np.int8:
+        return block
+    codes = np.where(np.isnan(block), MISSING_CODE, block)
+    if not np.isin(codes, (-1, 0, 1, MISSING_CODE)).all():
+        raise ValueError("Genotypes must be encoded as {-1, 0, 1} (see str2numConverter).")
+    return codes.astype(np.int8)
+
+
+def _code_index(block):
+    '''Table column of each int8 genotype: 0, 1, 2 for -1, 0, 1 and 3 for missing values.'''
+    index = _CODE_INDEX[block.view(np.uint8)]
+    if (index == 4).any():
+        raise ValueError("Genotypes must be encoded as {-1, 0, 1} (see str2numConverter).")
+    return index
+
+
+def _restrict_converter(converter, keep):
+    '''Restrict a fitted str2numConverter to a subset (boolean mask) of its columns.'''
+    converter.columns_ = [col for col, kept in zip(converter.columns_, keep) if kept]
+    if converter.lut_ is not None and converter.lut_.shape[0] > 1: # Per-column lookup tables
+        converter.lut_ = converter.lut_[keep]
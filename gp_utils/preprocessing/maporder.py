@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+
+from .genotype_matrix import is_genotype_matrix
+
+
+class MapOrderTransformer(BaseEstimator, TransformerMixin):
+    '''
+    Reorder genotype columns as a genetic map (see simCross.read_genetic_map), given as a map dataframe
+    or a map index (see simCross.read_map_index).
+    Markers absent from the map are dropped. The column permutation is computed once in fit,
+    so transform is a positional gather instead of a lookup by marker name.
+    '''
+    def __init__(self, genmap=None):
+        self.genmap = genmap
+
+    def fit(self, X, y=None):
+        '''
+        X: pandas dataframe or GenotypeMatrix
+        '''
+        columns = _columns(X)
+        self.columns_ = columns.tolist()
+        markers = self.genmap["marker"] if isinstance(self.genmap, np.ndarray) else self.genmap.index
+        perm = columns.get_indexer(markers)
+        self.permutation_ = perm[perm >= 0]
+        return self
+
+    def transform(self, X):
+        if _columns(X).tolist() != self.columns_:
+            raise ValueError("Input X columns do not match with training data.")
+        if is_genotype_matrix(X):
+            return X[:, self.permutation_] # Selects packed rows only
+        return X.iloc[:, self.permutation_]
+
+
+def _columns(X):
+    if is_genotype_matrix(X):
+        return X.markers
+    if not isinstance(X, pd.DataFrame):
+        raise TypeError("Input X must be a pandas DataFrame or a GenotypeMatrix.")
+    return X.columns
@@ -1,77 +1,119 @@
 import pandas as pd
 import numpy as np
-from sklearn.base import TransformerMixin
+from sklearn.base import BaseEstimator, TransformerMixin
 import re
 
-class str2numConverter(TransformerMixin):
+from .genotype_matrix import MISSING_CODE, is_genotype_matrix
+
+ALLELES = "ACGT"
+ALLELE_PAIRS = [a + b for a in ALLELES for b in ALLELES] # Allele-call code of "XY" is 4 * index(X) + index(Y)
+_INVALID = 127 # Lookup table entry of allele pairs not allowed in a column
+_BLOCK_VALUES = 1 << 21 # Genotype strings materialized at once when encoding a dataframe
+
+
+class str2numConverter(BaseEstimator, TransformerMixin):
     '''
     Convert genotype data into standardized numeric encoding {-1, 0, 1}.
     Supports numeric, A/H/B and allele-call encodings.
+
+    Genotype strings are factorized once per block of columns and mapped to small integer codes
+    (A/H/B, or one of the 16 allele pairs; missing values get the last code). Codes are then
+    converted in a single gather through per-column lookup tables built in fit. Only one block
+    of strings is materialized as a numpy array at a time, never a copy of the whole frame.
+
+    dtype: output dtype. Missing genotypes are NaN for float dtypes and MISSING_CODE for integer dtypes (e.g. np.int8).
     '''
-    def __init__(self, read_only=False):
+    def __init__(self, read_only=False, dtype=np.float64):
         self.reference_alleles_ = {} # Will store per-column allele mapping rules after fitting
-        self.encoding_type_ = None  # 'numeric_-101', 'numeric_012', 'AHB', 'allele_call'
+        self.encoding_type_ = None  # 'numeric_-101', 'numeric_012', 'AHB', 'allele_call', 'packed' (GenotypeMatrix)
         self.columns_ = None
         self.read_only = read_only # If True, only validates encoding types without recording and cannot perform transform
+        self.dtype = dtype
 
     def fit(self, X, y=None):
         """
         Learn allele mapping for each column if needed.
         Does not support monomorphic markers for unlabeled allele-call encoding.
         """
+        if is_genotype_matrix(X):
+            # Already encoded: only record marker names
+            self.reference_alleles_ = {}
+            self.lut_ = None
+            self.encoding_type_ = "packed"
+            if not self.read_only:
+                self.columns_ = X.markers.tolist()
+            return self
+
         if not isinstance(X, pd.DataFrame):
             raise TypeError("Input X must be a pandas DataFrame.")
         
         self.reference_alleles_ = {} # reset reference alleles
+        self.lut_ = None
         if not self.read_only:
             self.columns_ = X.columns.tolist() # reset marker names
 
-        sample_values = X.iloc[0:5].apply(lambda col: col.dropna().unique())
+        sample = X.iloc[0:5].to_numpy()
+        sample_values = pd.unique(sample[pd.notna(sample)])
 
         # Detect encoding type automatically
-        self.encoding_type_ = self._detect_encoding_type(sample_values)
+        self.encoding_type_ = self._detect_encoding_type(sample_values, X.columns)
 
-        if not self.read_only and self.encoding_type_ == "allele_call_unlabeled":
+        if self.read_only:
+            return self
+        if self.encoding_type_ == "allele_call_labeled":
+            self._learn_labeled_alleles(X.columns)
+        elif self.encoding_type_ == "allele_call_unlabeled":
             self._learn_reference_alleles(X)
-
+        if self.encoding_type_ in ("allele_call_labeled", "allele_call_unlabeled"):
+            self.lut_ = self._allele_call_lut()
+        elif self.encoding_type_ == "AHB":
+            self.lut_ = np.array([[1, 0, -1, MISSING_CODE]], dtype=np.int8) # Codes of A, H, B, missing
         return self
     
     def transform(self, X):
         """
         Convert the dataframe into numeric genotype matrix.
-        Returns a numpy array of shape (n_samples, n_markers).
+        Returns a numpy array of shape (n_samples, n_markers) and dtype self.dtype.
+        A GenotypeMatrix is already encoded and is only decoded to self.dtype.
         """
         if self.read_only:
             return None
 
-        if not isinstance(X, pd.DataFrame):
-            raise TypeError("Input X must be a pandas DataFrame.")
-
         if self.encoding_type_ is None:
             raise RuntimeError("You must fit the encoder before transforming data.")
+
+        if is_genotype_matrix(X):
+            if self.encoding_type_ != "packed" or X.markers.tolist() != self.columns_:
+                raise ValueError("Input X markers do not match with training data.")
+            if np.issubdtype(np.dtype(self.dtype), np.floating):
+                return X.to_numpy(dtype=self.dtype)
+            return X.to_numpy(dtype=np.int8).astype(self.dtype, copy=False) # Missing = MISSING_CODE
+
+        if not isinstance(X, pd.DataFrame):
+            raise TypeError("Input X must be a pandas DataFrame.")
         
         if X.columns.tolist() != self.columns_:
             raise ValueError("Input X columns do not match with training data.")
 
-        df = X.copy()
         if self.encoding_type_ == "numeric_-101":
-            return df.to_numpy(dtype=float)
+            return self._convert_numeric(X, shift=0)
         elif self.encoding_type_ == "numeric_012":
-            return (df.astype(float) - 1).to_numpy()
+            return self._convert_numeric(X, shift=-1)
         elif self.encoding_type_ == "AHB":
-            mapping = {"A": 1, "H": 0, "B": -1}
-            return df.replace(mapping).to_numpy(dtype=float)
-        elif self.encoding_type_ == "allele_call_labeled":
-            return self._convert_allele_call_labeled(df)
-        elif self.encoding_type_ == "allele_call_unlabeled":
-            return self._convert_allele_call_unlabeled(df) # Warning: does not allow monomorphic markers
+            return self._convert_codes(X, tokens=["A", "H", "B"])
+        elif self.encoding_type_ in ("allele_call_labeled", "allele_call_unlabeled"):
+            return self._convert_codes(X, tokens=ALLELE_PAIRS) # Warning: unlabeled encoding does not allow monomorphic markers
         else:
             raise ValueError(f"Unknown encoding type: {self.encoding_type_}")
 
+    def get_feature_names_out(self, input_features=None):
+        """Marker names of the output columns, so set_output(transform="pandas") can label them."""
+        return np.asarray(self.columns_, dtype=object)
+
     # ------ Internal utilities ------
-    def _detect_encoding_type(self, sample_values):
+    def _detect_encoding_type(self, sample_values, columns):
         """Heuristically detect encoding type from sample values."""
-        flattened = np.unique(np.concatenate(sample_values.values))
+        flattened = np.unique(np.array(sample_values.tolist()))
         
         numeric_vals, numeric_012, ahb, allele_like = False, False, False, False
 
@@ -91,49 +133,140 @@ class str2numConverter(TransformerMixin):
             return "AHB"
         elif allele_like:
             # Check if column names encode allele info
-            if all(re.search(r"_[ACGT]_[ACGT]$", col) for col in sample_values.index):
+            if all(re.search(r"_[ACGT]_[ACGT]$", col) for col in columns):
                 return "allele_call_labeled"
             else:
                 return "allele_call_unlabeled"
         else:
             raise ValueError("Unable to detect genotype encoding type.")
 
+    def _learn_labeled_alleles(self, columns):
+        """
+        For labeled allele calls, read the alleles from column names like 'SNP1_A_T' (ref A, alt T).
+        """
+        for col in columns:
+            match = re.search(r"_([ACGT])_([ACGT])$", col)
+            if not match:
+                raise ValueError(f"Cannot extract alleles from column name: {col}")
+            self.reference_alleles_[col] = match.groups()
+
     def _learn_reference_alleles(self, X):
         """
         For unlabeled allele calls, determine the reference allele per column
         (alphabetically first allele observed).
         Design choice: This function does not allow monomorphic markers
         """
-        for col in X.columns:
-            unique_vals = pd.Series(X[col].dropna().unique()).astype(str)
-            alleles = set(allele for pair in unique_vals for allele in pair)
-            if len(alleles) != 2:
-                raise ValueError(f"Column {col} has invalid allele pattern: {alleles}. Please make sure all markers are biallelic and polymorphic.")
-            ref, alt = sorted(list(alleles))
-            self.reference_alleles_[col] = (ref, alt)
+        counts = np.zeros((X.shape[1], len(ALLELE_PAIRS) + 1), dtype=np.int64)
+        for cols, codes in _iter_codes(X, tokens=ALLELE_PAIRS):
+            _add_code_counts(counts[cols], codes)
+        self.reference_alleles_ = _reference_alleles(counts, X.columns)
 
+    def _allele_call_lut(self):
+        ref = [self.reference_alleles_[col][0] for col in self.columns_]
+        alt = [self.reference_alleles_[col][1] for col in self.columns_]
+        return _allele_call_lut(ref, alt)
 
-    def _convert_allele_call_labeled(self, df):
+    def _convert_codes(self, X, tokens):
         """
-        Convert columns with names like 'SNP1_A_T' -> AA=1, TT=-1, AT=0
+        Convert string genotypes through the lookup table: out[i, j] = lut_[j, code[i, j]]
+        (a single row of lut_ is shared by all columns).
         """
-        out = np.zeros_like(df, dtype=float)
-        for i, col in enumerate(df.columns):
-            match = re.search(r"_([ACGT])_([ACGT])$", col)
-            if not match:
-                raise ValueError(f"Cannot extract alleles from column name: {col}")
-            ref, alt = match.groups()
-            mapping = {ref + ref: 1, alt + alt: -1, ref + alt: 0, alt + ref: 0}
-            out[:, i] = df[col].replace(mapping).to_numpy(dtype=float)
-        return out
+        n_codes = self.lut_.shape[1]
+        offsets = np.arange(X.shape[1]) * n_codes if self.lut_.shape[0] > 1 else np.zeros(X.shape[1], dtype=np.int64)
+        flat_lut = self.lut_.ravel()
+        out = np.empty(X.shape, dtype=np.int8)
+        for cols, codes in _iter_codes(X, tokens):
+            np.take(flat_lut, codes + offsets[cols], out=out[:, cols])
+        if (out == _INVALID).any():
+            i, j = np.argwhere(out == _INVALID)[0]
+            raise ValueError(f"Unexpected genotype {X.iat[i, j]} in column {X.columns[j]} with alleles {self.reference_alleles_[X.columns[j]]}.")
+        return self._as_output(out)
 
-    def _convert_allele_call_unlabeled(self, df):
-        """
-        Use reference alleles learned in fit().
-        """
-        out = np.zeros_like(df, dtype=float)
-        for i, col in enumerate(df.columns):
-            ref, alt = self.reference_alleles_[col]
-            mapping = {ref + ref: 1, alt + alt: -1, ref + alt: 0, alt + ref: 0}
-            out[:, i] = df[col].replace(mapping).to_numpy(dtype=float)
-        return out
+    def _convert_numeric(self, X, shift):
+        floating = np.issubdtype(np.dtype(self.dtype), np.floating)
+        # A single copy, already in the output dtype (the frame may only expose a read-only view)
+        values = X.to_numpy(dtype=self.dtype if floating else np.float64, copy=True)
+        if shift:
+            values += shift
+        if floating:
+            return values
+        return np.where(np.isnan(values), MISSING_CODE, values).astype(self.dtype)
+
+    def _as_output(self, out):
+        """int8 codes with MISSING_CODE -> self.dtype (NaN for missing values in float dtypes)."""
+        if not np.issubdtype(np.dtype(self.dtype), np.floating):
+            return out.astype(self.dtype, copy=False)
+        res = out.astype(self.dtype)
+        res[out == MISSING_CODE] = np.nan
+        return res
+
+
+### Internal utilities ###
+def _genotype_codes(values, tokens):
+    '''
+    Integer codes of a 2-D array of genotype strings: the index of each value in tokens,
+    len(tokens) for missing values. Values are factorized at once, not once per column.
+    '''
+    token_codes = {token: code for code, token in enumerate(tokens)}
+    ids, uniques = pd.factorize(values.ravel())
+    unexpected = [v for v in uniques if str(v) not in token_codes]
+    if unexpected:
+        raise ValueError(f"Unexpected genotype values: {unexpected[:5]}")
+    # Factorized ids -> codes, with id -1 (missing) taking the last entry
+    id_codes = np.array([token_codes[str(v)] for v in uniques] + [len(tokens)], dtype=np.int64)
+    return id_codes[ids].reshape(values.shape)
+
+
+def _iter_codes(X, tokens):
+    '''
+    Yield (column slice, integer codes of these columns), see _genotype_codes, over blocks of
+    columns of a dataframe. Slicing columns is cheap, unlike slicing rows of many extension-array
+    columns, so the frame is never converted to a single array of strings.
+    '''
+    block_columns = max(1, _BLOCK_VALUES // max(1, X.shape[0]))
+    for start in range(0, X.shape[1], block_columns):
+        cols = slice(start, start + block_columns)
+        yield cols, _genotype_codes(X.iloc[:, cols].to_numpy(), tokens)
+
+
+def _add_code_counts(counts, codes):
+    '''Add the occurrences of each code in each column of codes (n, p) to counts (p, n_codes), in place.'''
+    offsets = np.arange(counts.shape[0]) * counts.shape[1]
+    counts += np.bincount((codes + offsets).ravel(), minlength=counts.size).reshape(counts.shape)
+
+
+def _reference_alleles(counts, columns):
+    '''
+    (ref, alt) alleles of each column from its allele-pair code counts, ref being alphabetically first.
+    Raises a ValueError unless every column shows exactly two alleles.
+    '''
+    # Allele a is present if any observed pair contains it
+    pair_alleles = np.zeros((len(ALLELE_PAIRS) + 1, len(ALLELES)), dtype=np.int64)
+    for code, pair in enumerate(ALLELE_PAIRS):
+        pair_alleles[code, ALLELES.index(pair[0])] = 1
+        pair_alleles[code, ALLELES.index(pair[1])] = 1
+    present = (counts @ pair_alleles) > 0
+    for j in np.flatnonzero(present.sum(axis=1) != 2)[:1]:
+        alleles = {ALLELES[a] for a in np.flatnonzero(present[j])}
+        raise ValueError(f"Column {columns[j]} has invalid allele pattern: {alleles}. Please make sure all markers are biallelic and polymorphic.")
+    pairs = np.nonzero(present)[1].reshape(-1, 2) # nonzero is sorted: ref is alphabetically first
+    return {col: (ALLELES[ref], ALLELES[alt]) for col, (ref, alt) in zip(columns, pairs)}
+
+
+def _allele_call_lut(ref, alt):
+    '''
+    Per-column lookup table of shape (n_markers, 17) from allele-pair codes to {-1, 0, 1}:
+    ref/ref=1, alt/alt=-1, ref/alt=alt/ref=0, missing=MISSING_CODE, other pairs invalid.
+
+    ref, alt: reference and alternative allele letters of each column.
+    '''
+    ref = np.array([ALLELES.index(a) for a in ref], dtype=np.int64)
+    alt = np.array([ALLELES.index(a) for a in alt], dtype=np.int64)
+    lut = np.full((ref.size, len(ALLELE_PAIRS) + 1), _INVALID, dtype=np.int8)
+    lut[:, -1] = MISSING_CODE
+    rows = np.arange(ref.size)
+    lut[rows, 4 * ref + ref] = 1
+    lut[rows, 4 * alt + alt] = -1
+    lut[rows, 4 * ref + alt] = 0
+    lut[rows, 4 * alt + ref] = 0
+    return lut
@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+
+from .str2num import (
+    str2numConverter, MISSING_CODE, ALLELE_PAIRS,
+    _genotype_codes, _add_code_counts, _reference_alleles, _allele_call_lut, _INVALID, _BLOCK_VALUES
+)
+
+####################################
+### Streaming genotype ingestion ###
+####################################
+LAYOUTS = ["samples", "hapmap"]
+HAPMAP_INFO_COLUMNS = 11 # rs#, alleles, chrom, pos, strand, assembly#, center, protLSID, assayLSID, panelLSID, QCcode
+MISSING_TOKENS = ["N", "NN", "--", "-", "0/0"]
+
+
+def read_genotypes(filename, layout="samples", sep=",", chunksize=None, out=None, output_path=None, n_sample_rows=5):
+    '''
+    Encode a genotype file into an int8 matrix {-1, 0, 1} (samples x markers) without materializing
+    the file as a dataframe of strings. Missing genotypes are MISSING_CODE.
+
+    The file is read in chunks of lines holding about _BLOCK_VALUES genotypes (as str2numConverter
+    encodes dataframes), whatever the width of the file, and every chunk is encoded straight into the output.
+    The encoding is detected on the first n_sample_rows lines, as in str2numConverter. For unlabeled
+    allele calls, allele-pair codes are written first while allele counts are accumulated, then
+    remapped in place once the reference alleles of every marker are known.
+    Peak memory is about one chunk plus the output.
+
+    Parameters
+    ----------
+    filename: CSV/TSV genotype file.
+    layout: "samples" (one row per sample, first column sample names, header marker names) or
+            "hapmap" (one row per marker, 11 HapMap information columns, then one column per sample).
+    sep: field separator ("\t" for TSV and HapMap files).
+    chunksize: number of lines read at once. None (default) sizes chunks by the number of values per line.
+    out: preallocated int8 array of shape (n_samples, n_markers) to write into.
+    output_path: .npy file to write into as a memory map (np.lib.format.open_memmap). Ignored if out is given.
+
+    Return:
+    -------
+    (int8 array or memory map of shape (n_samples, n_markers), list of sample names, list of marker names)
+    '''
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unsupported layout: {layout}")
+    header = pd.read_csv(filename, sep=sep, index_col=0, nrows=0).columns.tolist()
+    n_rows = _count_rows(filename) - 1 # Blank lines are skipped by pandas
+    if layout == "samples":
+        markers = header
+        samples = None # Read along with the chunks
+        shape = (n_rows, len(markers))
+    else:
+        samples = header[HAPMAP_INFO_COLUMNS - 1:]
+        markers = None
+        shape = (len(samples), n_rows)
+
+    # Encoding detected on a few samples, as a samples x markers frame
+    sample = pd.read_csv(filename, sep=sep, index_col=0, nrows=n_sample_rows, na_values=MISSING_TOKENS)
+    if layout == "hapmap":
+        sample = sample.iloc[:, HAPMAP_INFO_COLUMNS - 1:].T
+    encoding_type = str2numConverter(read_only=True).fit(sample).encoding_type_
+    string_encoding = encoding_type in ("AHB", "allele_call_labeled", "allele_call_unlabeled")
+
+    if out is None:
+        out = np.lib.format.open_memmap(output_path, mode="w+", dtype=np.int8, shape=shape) if output_path is not None else np.full(shape, MISSING_CODE, dtype=np.int8)
+    elif out.shape != shape or out.dtype != np.int8:
+        raise ValueError(f"out must be an int8 array of shape {shape}.")
+
+    values_per_line = len(header) + 1 # Columns after the index, and the index itself
+    chunksize = max(1, _BLOCK_VALUES // values_per_line) if chunksize is None else chunksize
+    names, counts, start = [], None, 0
+    if encoding_type == "allele_call_unlabeled" and layout == "samples":
+        counts = np.zeros((shape[1], len(ALLELE_PAIRS) + 1), dtype=np.int64)
+    reader = pd.read_csv(
+        filename, sep=sep, index_col=0, chunksize=chunksize, na_values=MISSING_TOKENS,
+        dtype=object if string_encoding else None
+    )
+    for chunk in reader:
+        names.extend(chunk.index.tolist())
+        if layout == "hapmap":
+            values = chunk.iloc[:, HAPMAP_INFO_COLUMNS - 1:].to_numpy().T
+            target = (slice(None), slice(start, start + len(chunk)))
+            columns = chunk.index
+        else:
+            values = chunk.to_numpy()
+            target = (slice(start, start + len(chunk)), slice(None))
+            columns = chunk.columns
+        # HapMap chunks hold whole markers, so their reference alleles are known right away
+        out[target] = _encode_chunk(values, encoding_type, columns, counts=counts, complete=layout == "hapmap")
+        start += len(chunk)
+    if start != n_rows:
+        raise ValueError(f"Read {start} {'samples' if layout == 'samples' else 'markers'} but counted {n_rows} rows in {filename}.")
+
+    if counts is not None and layout == "samples":
+        lut = _allele_call_lut(*_ref_alt(_reference_alleles(counts, markers), markers))
+        block_rows = max(1, _BLOCK_VALUES // max(1, shape[1])) # Bounds the int64 codes of a block
+        for row in range(0, shape[0], block_rows):
+            rows = slice(row, row + block_rows)
+            out[rows] = _lookup(out[rows].astype(np.int64), lut, markers)
+
+    if layout == "samples":
+        samples = names
+    else:
+        markers = names
+    return out, samples, markers
+
+### Internal utilities ###
+def _count_rows(filename):
+    '''Number of non-blank lines of a text file (lines of whitespace only are skipped, as by pandas).'''
+    with open(filename, "rb") as f:
+        return sum(1 for line in f if not line.isspace())
+
+
+def _encode_chunk(values, encoding_type, columns, counts=None, complete=False):
+    '''
+    int8 codes of a samples x markers block of values.
+    Unlabeled allele calls are encoded right away if the block holds every sample of its markers (complete).
+    Otherwise they are returned as allele-pair codes (missing = 16) to be remapped once reference alleles
+    are known, and their occurrences are added to counts.
+    '''
+    if encoding_type in ("numeric_-101", "numeric_012"):
+        values = np.asarray(values, dtype=np.float64) - (encoding_type == "numeric_012")
+        return np.where(np.isnan(values), MISSING_CODE, values).astype(np.int8)
+    if encoding_type == "AHB":
+        return np.take(np.array([1, 0, -1, MISSING_CODE], dtype=np.int8), _genotype_codes(values, ["A", "H", "B"]))
+
+    codes = _genotype_codes(values, ALLELE_PAIRS)
+    if encoding_type == "allele_call_unlabeled" and not complete:
+        _add_code_counts(counts, codes)
+        return codes.astype(np.int8)
+    if encoding_type == "allele_call_unlabeled":
+        block_counts = np.zeros((codes.shape[1], len(ALLELE_PAIRS) + 1), dtype=np.int64)
+        _add_code_counts(block_counts, codes)
+        reference_alleles = _reference_alleles(block_counts, columns)
+    else:
+        labeled = str2numConverter()
+        labeled._learn_labeled_alleles(columns)
+        reference_alleles = labeled.reference_alleles_
+    return _lookup(codes, _allele_call_lut(*_ref_alt(reference_alleles, columns)), columns)
+
+
+def _lookup(codes, lut, columns=None):
+    '''out[i, j] = lut[j, codes[i, j]], checking that no allele pair outside a column's alleles was seen.'''
+    res = np.take(lut.ravel(), codes + np.arange(lut.shape[0]) * lut.shape[1])
+    if (res == _INVALID).any():
+        j = np.argwhere(res == _INVALID)[0, 1]
+        name = columns[j] if columns is not None else j
+        raise ValueError(f"Unexpected genotype {ALLELE_PAIRS[codes[:, j][res[:, j] == _INVALID][0]]} in marker {name}.")
+    return res
+
+
+def _ref_alt(reference_alleles, columns):
+    return [reference_alleles[col][0] for col in columns], [reference_alleles[col][1] for col in columns]
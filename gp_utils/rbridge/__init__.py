@@ -0,0 +1,7 @@
+from .rbridge import RSession, register_r_function, call_r
+
+__all__ = [
+    "RSession",
+    "register_r_function",
+    "call_r"
+]
@@ -0,0 +1,110 @@
+import os
+import time
+
+import numpy as np
+
+from utils import ensure_r_ready, register_backend, get_backend
+# from ..utils import ensure_r_ready, register_backend, get_backend
+
+###########################
+### R function registry ###
+###########################
+_R_FUNCTIONS = {} # name -> (R source defining the function, R packages it needs)
+
+def register_r_function(name, source, packages=()):
+    '''
+    Declare an R function. Nothing is sent to R here: the packages are attached and the source
+    is evaluated once per process, the first time the function is used.
+
+    name: name of the R function defined by source.
+    source: R code defining the function.
+    packages: R packages to attach before the first call.
+    '''
+    _R_FUNCTIONS[name] = (source, tuple(packages))
+
+
+def call_r(name, *args, outputs=None):
+    '''
+    Call a registered R function in the process-wide R session.
+
+    args: numpy arrays are sent to R as float64 column-major matrices/vectors; other values are converted by rpy2.
+    outputs: names of list elements of the R result to convert back into numpy arrays.
+             If None, the R result is returned as is.
+
+    Return:
+    -------
+    (result, timing). result is a dict {output name: numpy array} or the raw R object.
+    timing is a dict with the seconds spent converting to R ("to_r"), running in R ("compute")
+    and converting back ("from_r").
+    '''
+    return get_backend("R").call(name, *args, outputs=outputs)
+
+#################
+### R session ###
+#################
+class RSession:
+    '''
+    Embedded R interpreter shared by the whole process.
+    Packages are attached once and every registered function is defined once; function handles are cached.
+    '''
+    def __init__(self):
+        ensure_r_ready()
+        import rpy2.robjects as robjects # Importing rpy2.robjects starts R
+        from rpy2.robjects import default_converter, numpy2ri
+        from rpy2.robjects.conversion import localconverter
+        self.robjects = robjects
+        self.converter = default_converter + numpy2ri.converter
+        self.localconverter = localconverter
+        self.pid = os.getpid()
+        self.packages_ = set()
+        self.functions_ = {}
+        self.stats_ = {} # name -> cumulative {"calls", "to_r", "compute", "from_r"}
+
+    def function(self, name):
+        '''Handle of a registered R function, defining it (and attaching its packages) on first use.'''
+        self._check_process()
+        if name not in self.functions_:
+            if name not in _R_FUNCTIONS:
+                raise ValueError(f"Unknown R function: {name}")
+            source, packages = _R_FUNCTIONS[name]
+            for package in packages:
+                if package not in self.packages_:
+                    self.robjects.r(f"suppressPackageStartupMessages(library({package}))")
+                    self.packages_.add(package)
+            self.robjects.r(source)
+            self.functions_[name] = self.robjects.r[name]
+        return self.functions_[name]
+
+    def call(self, name, *args, outputs=None):
+        func = self.function(name)
+
+        start = time.perf_counter()
+        with self.localconverter(self.converter) as cv:
+            r_args = [cv.py2rpy(_as_r_array(arg)) if isinstance(arg, np.ndarray) else cv.py2rpy(arg) for arg in args]
+        to_r = time.perf_counter()
+
+        result = func(*r_args)
+        compute = time.perf_counter()
+
+        if outputs is not None:
+            with self.localconverter(self.converter):
+                result = {key: np.array(result.rx2(key)) for key in outputs}
+        from_r = time.perf_counter()
+
+        timing = {"to_r": to_r - start, "compute": compute - to_r, "from_r": from_r - compute}
+        stats = self.stats_.setdefault(name, {"calls": 0, "to_r": 0.0, "compute": 0.0, "from_r": 0.0})
+        stats["calls"] += 1
+        for key, value in timing.items():
+            stats[key] += value
+        return result, timing
+
+    def _check_process(self):
+        if os.getpid() != self.pid:
+            raise RuntimeError("The R session was started in a parent process and is not fork-safe. Use spawn-based worker processes.")
+
+
+def _as_r_array(X):
+    '''float64 column-major view of X, copied only if X is not already in that layout.'''
+    return np.asarray(X, dtype=np.float64, order="F")
+
+register_backend("R", RSession)
@@ -1,7 +1,8 @@
-from .reducers import NoOpReducer, LassoReducer, init_reducer
+from .reducers import NoOpReducer, LassoReducer, LDPruneReducer, init_reducer
 
 __all__ = [
     "NoOpReducer",
     "LassoReducer",
+    "LDPruneReducer",
     "init_reducer"
 ]
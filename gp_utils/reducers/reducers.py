@@ -1,13 +1,18 @@
 import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
 
 from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.model_selection import train_test_split
 from sklearn.linear_model import Lasso, LinearRegression
+from sklearn.utils import check_array
 
 from feature_engine.selection import SmartCorrelatedSelection
 
 # from ..evaluations import pear_scorer
 from evaluations import pear_scorer
+# from ..preprocessing import is_genotype_matrix
+from preprocessing import is_genotype_matrix
 
 #######################
 ### Custom reducers ###
@@ -16,60 +21,225 @@ class NoOpReducer(BaseEstimator, TransformerMixin):
     '''
     X: numpy array or pandas dataframe
     y: numpy array or pandas series
+    copy: if False, transform returns X itself instead of a copy.
     '''
+    def __init__(self, copy=True):
+        self.copy = copy
+
     def fit(self, X, y=None):
         return self
     
     def transform(self, X):
+        if is_genotype_matrix(X) or not self.copy:
+            return X # Packed matrices are never modified in place
         return np.copy(X)
 
 
 class LassoReducer(BaseEstimator, TransformerMixin):
-    def __init__(self, alpha=0.1, r=0.1, test_size=0.2, n_reps=200, max_iter=10000, random_state=42):
+    '''
+    Stability selection with Lasso: a marker is kept if it is selected in more than r * n_reps
+    Lasso fits on random subsamples (or in at least one fit if no marker reaches that ratio).
+
+    Subsample fits are split in consecutive chunks of chunk_size reps. Within a chunk, coordinate descent
+    is warm-started from the previous solution; chunks run in parallel on n_jobs threads.
+    The chunk layout does not depend on n_jobs, so neither does the selection.
+    '''
+    def __init__(self, alpha=0.1, r=0.1, test_size=0.2, n_reps=200, max_iter=10000, random_state=42, n_jobs=1, chunk_size=25):
         self.alpha = alpha
         self.r = r
         self.test_size = test_size
         self.n_reps = n_reps
         self.max_iter = max_iter
-        self.selects_ind = [] # lst[lst[bool]]
         self.random_state = random_state
+        self.n_jobs = n_jobs
+        self.chunk_size = chunk_size
 
     def fit(self, X, y):
         '''
         X: numpy array or pandas dataframe
         y: numpy array or pandas series
         '''
-        self.selects_ind = []
-        for i in range(self.n_reps):
-            X_tr, _, y_tr, _ = train_test_split(X, y, test_size=self.test_size, random_state=i)
-            l_model = Lasso(alpha=self.alpha, max_iter=self.max_iter, random_state=self.random_state).fit(X_tr, y_tr)
-
-            select = abs(l_model.coef_) > 0
-            self.selects_ind.append(select)
+        if is_genotype_matrix(X):
+            X.check_complete() # Decoded whole below; missing genotypes would be NaN
+        X = check_array(X, dtype=[np.float64, np.float32]) # float32 inputs are fitted in float32
+        y = np.asarray(y, dtype=np.float64)
+        chunks = [range(start, min(start + self.chunk_size, self.n_reps)) for start in range(0, self.n_reps, self.chunk_size)]
+        # Coordinate descent releases the GIL, so threads share X without copies
+        counts = Parallel(n_jobs=self.n_jobs, prefer="threads")(
+            delayed(self._count_selections)(X, y, reps) for reps in chunks
+        )
+        self.select_counts_ = np.sum(counts, axis=0, dtype=np.int64)
+        self.support_ = self._aggregate_counts(select_counts=self.select_counts_, n_reps=self.n_reps, r=self.r)
         return self
     
     def transform(self, X):
-        if not self.selects_ind:
+        if not hasattr(self, "support_"):
             raise ValueError("The reducer has not been fitted yet.")
-        agg_ind = self._aggregate_binary_lists(selects_ind=self.selects_ind, r=self.r)
-        return X[:, agg_ind]
+        return X[:, self.support_]
 
     ### Internal utilities ###
-    def _aggregate_binary_lists(self, selects_ind, r):
+    def _count_selections(self, X, y, reps):
+        '''Number of times each marker is selected over the subsample fits of reps, warm-started one after another.'''
+        counts = np.zeros(X.shape[1], dtype=np.int64)
+        l_model = Lasso(alpha=self.alpha, max_iter=self.max_iter, random_state=self.random_state, warm_start=True)
+        for i in reps:
+            # Same subsample as train_test_split(X, y, test_size, random_state=i), without copying X twice
+            tr_idx, _ = train_test_split(np.arange(X.shape[0]), test_size=self.test_size, random_state=i)
+            l_model.fit(X[tr_idx], y[tr_idx])
+            counts += l_model.coef_ != 0
+        return counts
+
+    def _aggregate_counts(self, select_counts, n_reps, r):
         '''
-        Filtered union of binary lists.
+        Filtered union of the selections.
 
         Parameters
         ----------
-        selects_ind: list of binary lists
+        select_counts: number of selections of each marker
+        n_reps: number of selections
         r: ratio
         '''
-        ones_count = [sum(row[i] for row in selects_ind) for i in range(len(selects_ind[0]))] # Compute the number of 1s at each position
-        threshold = r * len(selects_ind) # Determine the threshold
-        if threshold > max(ones_count):
-            return np.array(ones_count) > 0 # If threshold too high, return features that have been selected at least once.
-        return np.array(ones_count) > threshold # Construct the output list
+        threshold = r * n_reps # Determine the threshold
+        if threshold > select_counts.max():
+            return np.flatnonzero(select_counts > 0) # If threshold too high, return features that have been selected at least once.
+        return np.flatnonzero(select_counts > threshold)
     
+class LDPruneReducer(BaseEstimator, TransformerMixin):
+    '''
+    Map-aware LD pruning: among markers less than window columns apart on the same chromosome whose
+    absolute correlation exceeds threshold, only the most informative one is kept.
+
+    Columns are expected in genetic map order (see MapOrderTransformer).
+    X can be a GenotypeMatrix, decoded one block at a time. Correlations are computed
+    in blocks of standardized float32 columns against the next window columns only, then markers
+    are visited from the most to the least informative, each kept marker discarding its correlated neighbours.
+
+    Parameters
+    ----------
+    window: number of following columns each marker is compared with.
+    threshold: absolute correlation above which two markers are redundant.
+    chromosomes: chromosome of each marker, looked up by column name at fit time: a genetic map (dataframe
+                 with a "chr" column or map index, see simCross.read_genetic_map), or a pandas series or dict
+                 marker -> chromosome. Markers absent from it are never pruned. Column names come from
+                 dataframes or GenotypeMatrix inputs; in init_pipeline, preprocessing steps then output
+                 dataframes so the names of the markers left by the preceding steps reach the reducer.
+                 A sequence of one label per column is also accepted. None treats all columns as one chromosome.
+    criterion: "target" ranks markers by their absolute correlation with y, "variance" by their variance.
+    block_size: number of columns standardized and correlated at once.
+    '''
+    def __init__(self, window=50, threshold=0.8, chromosomes=None, criterion="target", block_size=256):
+        self.window = window
+        self.threshold = threshold
+        self.chromosomes = chromosomes
+        self.criterion = criterion
+        self.block_size = block_size
+
+    def fit(self, X, y=None):
+        '''
+        X: numpy array or pandas dataframe
+        y: numpy array or pandas series
+        '''
+        if is_genotype_matrix(X):
+            names = X.markers
+            n, p = X.shape
+            mean, var, _ = X.column_stats()
+            std = np.sqrt(np.nan_to_num(var))
+        else:
+            names = X.columns if isinstance(X, pd.DataFrame) else None
+            X = np.asarray(X)
+            n, p = X.shape
+            mean = X.mean(axis=0, dtype=np.float64)
+            std = X.std(axis=0, dtype=np.float64)
+        inv_std = np.divide(1.0, std, out=np.zeros(p), where=std > 0) # Constant columns correlate with nothing
+        chrom = self._chromosome_codes(names, p)
+
+        if self.criterion not in ("target", "variance"):
+            raise ValueError(f"Unsupported criterion: {self.criterion}")
+        use_target = self.criterion == "target" and y is not None
+        if use_target:
+            yc = np.asarray(y, dtype=np.float64) - np.mean(y)
+            yc = (yc / (np.linalg.norm(yc) * np.sqrt(n) or 1.0)).astype(np.float32)
+            score = np.empty(p)
+        else:
+            score = std ** 2
+
+        # Redundant pairs (i, i + offset) within the window, one block of columns at a time
+        pairs_i, pairs_j = [], []
+        for start in range(0, p, self.block_size):
+            stop = min(start + self.block_size, p)
+            Z = self._standardize(X, mean, inv_std, start, min(stop + self.window, p))
+            if use_target:
+                score[start:stop] = np.abs(yc @ Z[:, :stop - start])
+            corr = Z[:, :stop - start].T @ Z / n
+            i, j = np.nonzero(np.abs(corr) > self.threshold)
+            i, j = i + start, j + start
+            keep = (j > i) & (j - i <= self.window) & (chrom[i] == chrom[j]) & (chrom[i] >= 0)
+            pairs_i.append(i[keep])
+            pairs_j.append(j[keep])
+        pairs_i, pairs_j = np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+        # Neighbour lists in CSR form, then a greedy pass from the most informative marker
+        src = np.concatenate([pairs_i, pairs_j])
+        dst = np.concatenate([pairs_j, pairs_i])
+        order = np.argsort(src, kind="stable")
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(src, minlength=p))))
+        neighbours = dst[order]
+        removed = np.zeros(p, dtype=bool)
+        for i in np.argsort(-score, kind="stable"):
+            if not removed[i]:
+                removed[neighbours[indptr[i]:indptr[i + 1]]] = True
+        self.support_ = np.flatnonzero(~removed)
+        self.scores_ = score
+        return self
+
+    def transform(self, X):
+        if not hasattr(self, "support_"):
+            raise ValueError("The reducer has not been fitted yet.")
+        if isinstance(X, pd.DataFrame):
+            X = X.to_numpy()
+        return X[:, self.support_]
+
+    def requires_feature_names(self):
+        '''True if chromosomes are looked up by marker name, so fit needs the column names of X.'''
+        return self.chromosomes is not None and _chromosome_mapping(self.chromosomes) is not None
+
+    ### Internal utilities ###
+    def _chromosome_codes(self, names, p):
+        '''Integer chromosome code of each column, -1 for markers absent from a chromosome mapping.'''
+        if self.chromosomes is None:
+            return np.zeros(p, dtype=np.int64)
+        mapping = _chromosome_mapping(self.chromosomes)
+        if mapping is None:
+            chrom = pd.factorize(np.asarray(self.chromosomes))[0]
+            if chrom.size != p:
+                raise ValueError("chromosomes must have one label per column, or map marker names to chromosomes.")
+            return chrom
+        if names is None:
+            raise ValueError("chromosomes maps marker names to chromosomes, so X must be a pandas dataframe or a GenotypeMatrix.")
+        return pd.factorize(mapping.reindex(pd.Index(names)).to_numpy())[0] # Unmapped markers (NaN) get -1
+
+    def _standardize(self, X, mean, inv_std, start, stop):
+        '''
+        Columns start:stop of X centered and scaled to unit variance, as float32.
+        Missing genotypes of a GenotypeMatrix are set to the mean (0 after centering).
+        '''
+        if is_genotype_matrix(X):
+            Z = (X.decode(slice(start, stop), dtype=np.float32) - mean[start:stop]) * inv_std[start:stop]
+            return np.nan_to_num(Z, copy=False).astype(np.float32, copy=False)
+        return ((X[:, start:stop] - mean[start:stop]) * inv_std[start:stop]).astype(np.float32)
+
+def _chromosome_mapping(chromosomes):
+    '''pandas series marker -> chromosome of a genetic map, series or dict, None for a sequence of per-column labels.'''
+    if isinstance(chromosomes, pd.DataFrame):
+        return chromosomes["chr"]
+    if isinstance(chromosomes, np.ndarray) and chromosomes.dtype.names is not None:
+        return pd.Series(chromosomes["chr"], index=chromosomes["marker"])
+    if isinstance(chromosomes, pd.Series):
+        return chromosomes
+    if isinstance(chromosomes, dict):
+        return pd.Series(chromosomes)
+    return None
+
 ######################
 ### Initialization ###
 ######################
@@ -98,7 +268,15 @@ def init_reducer(reducer_name: str, reducer_params: dict, random_state: int = 42
             test_size=reducer_params['test_size'] if 'test_size' in reducer_params else (1-reducer_params['sample_size']),
             n_reps=reducer_params['n_reps'],
             r=reducer_params['r'] if 'r' in reducer_params else reducer_params['threshold'],
-            random_state=random_state
+            random_state=random_state,
+            n_jobs=reducer_params.get('n_jobs', 1)
+        )
+    elif reducer_name == "LDFS":
+        model = LDPruneReducer(
+            window=reducer_params.get('window', 50),
+            threshold=reducer_params['threshold'] if 'threshold' in reducer_params else reducer_params['corr_threshold'],
+            chromosomes=reducer_params.get('chromosomes'),
+            criterion=reducer_params.get('criterion', "target")
         )
     else:
         raise ValueError("Unsupported reducer")
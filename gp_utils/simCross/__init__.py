@@ -1,7 +1,27 @@
-from .simCross import read_cross_func, map_snp_order_func, sim_cross_with_genos
+from .simCross import read_cross_func, map_snp_order_func, sim_cross_with_genos, genmap_to_frame
+from .genmap import read_genetic_map, read_map_index, map_marker_order, map_markers, marker_permutation, reorder_to_map
+from .batch import iter_sim_crosses, sim_crosses_to_disk
+from .ril import sim_ril_selfing, recombination_fractions, ril_recombination_fractions, observed_recombination_fractions
+from .usefulness import selection_intensity, cross_usefulness, rank_crosses
 
 __all__ = [
     "read_cross_func",
     "map_snp_order_func",
-    "sim_cross_with_genos"
+    "sim_cross_with_genos",
+    "genmap_to_frame",
+    "read_genetic_map",
+    "read_map_index",
+    "map_marker_order",
+    "map_markers",
+    "marker_permutation",
+    "reorder_to_map",
+    "iter_sim_crosses",
+    "sim_crosses_to_disk",
+    "sim_ril_selfing",
+    "recombination_fractions",
+    "ril_recombination_fractions",
+    "observed_recombination_fractions",
+    "selection_intensity",
+    "cross_usefulness",
+    "rank_crosses"
 ]
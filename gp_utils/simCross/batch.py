@@ -0,0 +1,122 @@
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .ril import sim_ril_selfing
+from .genmap import reorder_to_map
+from .simCross import _progeny_from_origin, _is_numeric_geno, _geno_values
+
+###################################################
+### Simulate progenies for many crosses p1 x p2 ###
+###################################################
+_WORKER_STATE = {} # Per-process simulation settings, set once by _init_worker.
+
+
+def iter_sim_crosses(parent_genos, jobs, genmap, reduce_hetero=False, numeric_hetero_type=0, map_function="morgan", random_state=None, n_jobs=1, max_pending=None):
+    '''
+    Simulate progeny genotypes for many crosses with the native simulator and yield them one cross at a time.
+
+    Every cross gets its own random stream spawned from random_state, so results do not depend
+    on n_jobs or on the order in which workers finish.
+
+    Parameters
+    ----------
+    parent_genos: pandas dataframe of parent genotypes (parents x markers). Columns are reordered to genmap.
+    jobs: list of (p1, p2, n_progeny) with p1, p2 labels of parent_genos.index.
+    genmap: map dataframe with columns "chr" and "pos" (see genmap_to_frame).
+    random_state: None, int or numpy SeedSequence.
+    n_jobs: number of worker processes. 1 runs in the current process, -1 uses all cores.
+    max_pending: maximum number of crosses held in memory at once. Defaults to 2 * n_jobs.
+
+    Yield:
+    ------
+    ((p1, p2, n_progeny), pandas dataframe of shape (n_progeny, n_markers)), in the order of jobs.
+    '''
+    jobs = list(jobs)
+    parent_genos = reorder_to_map(parent_genos, genmap)
+    seed_seq = random_state if isinstance(random_state, np.random.SeedSequence) else np.random.SeedSequence(random_state)
+    seeds = seed_seq.spawn(len(jobs))
+    settings = {
+        "genmap": genmap,
+        "reduce_hetero": reduce_hetero,
+        "numeric_hetero_type": numeric_hetero_type,
+        "map_function": map_function
+    }
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+    if n_jobs == 1:
+        _init_worker(settings)
+        for job, seed in zip(jobs, seeds):
+            yield job, pd.DataFrame(_sim_cross_task(*_job_task(parent_genos, job, seed)), columns=parent_genos.columns)
+        return
+
+    max_pending = max_pending if max_pending is not None else 2 * n_jobs
+    with ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker, initargs=(settings,)) as executor:
+        pending = deque()
+        for job, seed in zip(jobs, seeds):
+            pending.append((job, executor.submit(_sim_cross_task, *_job_task(parent_genos, job, seed))))
+            if len(pending) >= max_pending:
+                job, future = pending.popleft()
+                yield job, pd.DataFrame(future.result(), columns=parent_genos.columns)
+        while pending:
+            job, future = pending.popleft()
+            yield job, pd.DataFrame(future.result(), columns=parent_genos.columns)
+
+
+def sim_crosses_to_disk(parent_genos, jobs, genmap, output_dir, **kwargs):
+    '''
+    Stream the crosses of iter_sim_crosses to output_dir, one file per cross.
+
+    Numeric genotypes are saved as .npy, other encodings as .csv. Marker names are written once
+    to markers.txt and crosses.csv lists (cross, p1, p2, n_progeny, file) as crosses complete,
+    so an interrupted run keeps every finished cross.
+
+    kwargs: passed to iter_sim_crosses.
+
+    Return:
+    -------
+    Path of crosses.csv.
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    pd.Series(parent_genos.columns).to_csv(os.path.join(output_dir, "markers.txt"), index=False, header=False)
+    manifest_path = os.path.join(output_dir, "crosses.csv")
+    pd.DataFrame(columns=["cross", "p1", "p2", "n_progeny", "file"]).to_csv(manifest_path, index=False)
+
+    for i, ((p1, p2, n_progeny), progeny) in enumerate(iter_sim_crosses(parent_genos, jobs, genmap, **kwargs)):
+        if all(pd.api.types.is_numeric_dtype(dtype) for dtype in progeny.dtypes):
+            filename = f"cross_{i:06d}.npy"
+            np.save(os.path.join(output_dir, filename), progeny.to_numpy())
+        else:
+            filename = f"cross_{i:06d}.csv"
+            progeny.to_csv(os.path.join(output_dir, filename), index=False)
+        pd.DataFrame([[i, p1, p2, n_progeny, filename]]).to_csv(manifest_path, mode="a", index=False, header=False)
+    return manifest_path
+
+### Internal utilities ###
+def _job_task(parent_genos, job, seed):
+    '''Arguments of _sim_cross_task for one job. Only the two parent rows are sent to a worker.'''
+    p1, p2, n_progeny = job
+    p1_geno, p2_geno = parent_genos.loc[p1], parent_genos.loc[p2]
+    numeric_marker = _is_numeric_geno(p1_geno) and _is_numeric_geno(p2_geno)
+    return _geno_values(p1_geno, numeric_marker), _geno_values(p2_geno, numeric_marker), n_progeny, numeric_marker, seed
+
+
+def _init_worker(settings):
+    _WORKER_STATE.clear()
+    _WORKER_STATE.update(settings)
+
+
+def _sim_cross_task(p1, p2, n_progeny, numeric_marker, seed):
+    rng = np.random.default_rng(seed)
+    origin = sim_ril_selfing(_WORKER_STATE["genmap"], n_progeny, map_function=_WORKER_STATE["map_function"], random_state=rng)
+    return _progeny_from_origin(
+        origin=origin,
+        p1=p1,
+        p2=p2,
+        reduce_hetero=_WORKER_STATE["reduce_hetero"] and numeric_marker,
+        numeric_hetero_type=_WORKER_STATE["numeric_hetero_type"],
+        rng=rng
+    )
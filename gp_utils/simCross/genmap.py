@@ -0,0 +1,160 @@
+import csv
+import os
+import hashlib
+import warnings
+
+import numpy as np
+import pandas as pd
+
+##############################
+### Native genetic map I/O ###
+##############################
+MAP_INDEX_SUFFIX = ".mapidx.npy"
+_MAP_INDEX_VERSION = 2 # Bump when the layout of the index changes
+
+
+def read_genetic_map(filename, jitter=1e-6, cache=True, cache_dir=None):
+    '''
+    Native counterpart of read_cross_func: read the map of a csvr file
+    (read.cross(format="csvr") + pull.map + jittermap) without starting R.
+
+    Markers are sorted by position within chromosomes, chromosomes are ordered numerically
+    (then other names in order of appearance, X last), and every marker is shifted by
+    jitter times its rank within its chromosome so no two markers share a position.
+
+    cache, cache_dir: see read_map_index. The dataframe is built from the index; use read_map_index
+                      directly to keep the memory-mapped index (e.g. for marker_permutation).
+
+    Return:
+    -------
+    Pandas dataframe indexed by marker name with columns "chr" and "pos" (cM), in map order.
+    The row number of a marker is its column in simulated genotype matrices.
+    '''
+    return _index_to_frame(read_map_index(filename, jitter=jitter, cache=cache, cache_dir=cache_dir))
+
+
+def read_map_index(filename, jitter=1e-6, cache=True, cache_dir=None):
+    '''
+    Genetic map of a csvr file (see read_genetic_map) as a numpy structured array with fields
+    "marker", "chr" and "pos", in map order.
+
+    With cache=True, the index is saved as a binary file and memory-mapped on later calls with the
+    same jitter, until the csvr file changes. The file name holds the index version and the jitter,
+    so other jitters get their own index. It is written next to the csvr file, or in cache_dir if given;
+    if that directory is not writable, the map is parsed on every call.
+    '''
+    index_path = _index_path(filename, jitter, cache_dir)
+    if cache and os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(filename):
+        return np.load(index_path, mmap_mode="r")
+
+    genmap = _read_csvr_map(filename)
+    genmap["pos"] += genmap.groupby("chr", sort=False).cumcount().to_numpy() * jitter
+    index = _frame_to_index(genmap)
+    if cache:
+        _save_index(index_path, index)
+    return index
+
+
+def map_marker_order(genmap):
+    '''Native counterpart of map_snp_order_func: marker names ordered as the genetic map, over all chromosomes.'''
+    return map_markers(genmap).tolist()
+
+
+def map_markers(genmap):
+    '''Marker names of a map dataframe or map index (see read_map_index), as a numpy array in map order.'''
+    if isinstance(genmap, np.ndarray):
+        return genmap["marker"]
+    return genmap.index.to_numpy()
+
+
+def marker_permutation(columns, genmap):
+    '''
+    Integer positions of the genetic map markers in columns, in map order:
+    X[:, perm] is X with its columns ordered as genmap.
+    genmap: map dataframe, or map index (see read_map_index), read without building a dataframe.
+    Raises a ValueError if a map marker is missing from columns.
+    '''
+    markers = map_markers(genmap)
+    perm = pd.Index(columns).get_indexer(markers)
+    if (perm < 0).any():
+        missing = markers[perm < 0]
+        raise ValueError(f"{len(missing)} genetic map markers are missing from the genotypes, e.g. {missing[:5].tolist()}.")
+    return perm
+
+
+def reorder_to_map(X, genmap, perm=None):
+    '''
+    Order the columns of a genotype dataframe (or series) as the genetic map.
+    perm: precomputed marker_permutation(X columns, genmap), to skip name lookups in repeated calls.
+    '''
+    if isinstance(X, pd.Series):
+        perm = marker_permutation(X.index, genmap) if perm is None else perm
+        return X.iloc[perm]
+    perm = marker_permutation(X.columns, genmap) if perm is None else perm
+    return X.iloc[:, perm]
+
+### Internal utilities ###
+def _read_csvr_map(filename):
+    '''Marker rows (name, chromosome, position) of a csvr file. Phenotype rows have an empty chromosome.'''
+    markers, chroms, positions = [], [], []
+    with open(filename, newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 3 or not row[1].strip():
+                continue
+            if not row[2].strip():
+                raise ValueError(f"Marker {row[0]} has no map position.")
+            markers.append(row[0].strip())
+            chroms.append(row[1].strip())
+            positions.append(float(row[2]))
+
+    genmap = pd.DataFrame({"chr": chroms, "pos": positions}, index=pd.Index(markers, name="marker"))
+    chr_rank = {c: i for i, c in enumerate(_chromosome_order(pd.unique(genmap["chr"])))}
+    order = np.lexsort((genmap["pos"].to_numpy(), genmap["chr"].map(chr_rank).to_numpy()))
+    return genmap.iloc[order].copy()
+
+
+def _chromosome_order(chroms):
+    numeric = sorted((c for c in chroms if c.isdigit()), key=int)
+    x_chr = [c for c in chroms if c.upper() == "X"]
+    others = [c for c in chroms if not c.isdigit() and c.upper() != "X"]
+    return numeric + others + x_chr
+
+
+def _index_path(filename, jitter, cache_dir):
+    name = f"{filename}.v{_MAP_INDEX_VERSION}.jitter{float(jitter)!r}{MAP_INDEX_SUFFIX}"
+    if cache_dir is None:
+        return name
+    # Data files of the same name in different directories get different indexes
+    digest = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, f"{digest}.{os.path.basename(name)}")
+
+
+def _save_index(index_path, index):
+    '''Write the index atomically (readers never see a partial file). Read-only directories only emit a warning.'''
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            np.save(f, index)
+        os.replace(tmp_path, index_path)
+    except OSError as e:
+        warnings.warn(f"Could not cache the genetic map index at {index_path} ({e}); the map will be parsed again on the next call.")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _frame_to_index(genmap):
+    marker_width = max(1, genmap.index.str.len().max())
+    chr_width = max(1, genmap["chr"].str.len().max())
+    index = np.empty(len(genmap), dtype=[("marker", f"U{marker_width}"), ("chr", f"U{chr_width}"), ("pos", "f8")])
+    index["marker"] = genmap.index.to_numpy()
+    index["chr"] = genmap["chr"].to_numpy()
+    index["pos"] = genmap["pos"].to_numpy()
+    return index
+
+
+def _index_to_frame(index):
+    return pd.DataFrame(
+        {"chr": index["chr"].astype(str), "pos": np.asarray(index["pos"])},
+        index=pd.Index(index["marker"].astype(str), name="marker")
+    )
@@ -0,0 +1,123 @@
+import numpy as np
+
+#####################
+### Map functions ###
+#####################
+# Convert genetic distances (Morgans) into recombination fractions.
+MAP_FUNCTIONS = {
+    "morgan": lambda d: np.minimum(d, 0.5),
+    "haldane": lambda d: 0.5 * (1 - np.exp(-2 * d)),
+    "kosambi": lambda d: 0.5 * np.tanh(2 * d),
+}
+
+
+def recombination_fractions(genmap, map_function="morgan"):
+    '''
+    Recombination fraction between each marker and the previous one in map order.
+
+    Parameters
+    ----------
+    genmap: pandas dataframe indexed by marker name with columns "chr" and "pos" (cM), in map order.
+    map_function: "morgan", "haldane" or "kosambi".
+
+    Return:
+    -------
+    numpy array of length n_markers. The first marker of every chromosome gets 0.5 (independent assortment).
+    '''
+    if map_function not in MAP_FUNCTIONS:
+        raise ValueError(f"Unsupported map function: {map_function}")
+    chrom = genmap["chr"].to_numpy()
+    pos = genmap["pos"].to_numpy(dtype=float)
+    r = np.full(len(genmap), 0.5)
+    same_chr = chrom[1:] == chrom[:-1]
+    dist = np.clip(np.diff(pos) / 100, 0, None) # cM -> Morgans
+    r[1:][same_chr] = MAP_FUNCTIONS[map_function](dist[same_chr])
+    return r
+
+
+def ril_recombination_fractions(r):
+    '''Haldane-Waddington map expansion for recombinant inbred lines by selfing: R = 2r / (1 + 2r).'''
+    r = np.asarray(r, dtype=float)
+    return 2 * r / (1 + 2 * r)
+
+
+def observed_recombination_fractions(origin):
+    '''
+    Fraction of individuals whose parent of origin switches between adjacent markers.
+    Used to validate simulated crosses (native or R) against ril_recombination_fractions.
+    '''
+    origin = np.asarray(origin)
+    res = np.full(origin.shape[1], 0.5)
+    res[1:] = (origin[:, 1:] != origin[:, :-1]).mean(axis=0)
+    return res
+
+###########################################
+### Recombinant inbred lines by selfing ###
+###########################################
+def chromosome_slices(genmap):
+    '''Contiguous column slices of each chromosome, in map order.'''
+    chrom = genmap["chr"].to_numpy()
+    breaks = np.flatnonzero(chrom[1:] != chrom[:-1]) + 1
+    bounds = np.concatenate(([0], breaks, [len(chrom)]))
+    return [slice(start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def sim_ril_selfing(genmap, n_progeny, map_function="morgan", max_generations=200, random_state=None):
+    '''
+    Native counterpart of qtl::sim.cross(type="riself"): simulate recombinant inbred lines
+    derived from a p1 x p2 F1 by single-seed descent until every locus is homozygous.
+
+    Crossovers are sampled independently in each marker interval with the probability given
+    by the map function, for all individuals at once. Individuals that are already fully
+    inbred on a chromosome are dropped from further generations.
+
+    Parameters
+    ----------
+    genmap: pandas dataframe indexed by marker name with columns "chr" and "pos" (cM), in map order.
+    n_progeny: number of lines to simulate.
+    map_function: "morgan", "haldane" or "kosambi".
+    random_state: None, int or numpy Generator.
+
+    Return:
+    -------
+    int8 numpy array of shape (n_progeny, n_markers), each component is 1 or 2 indicating the parent.
+    '''
+    rng = np.random.default_rng(random_state)
+    r = recombination_fractions(genmap, map_function=map_function).astype(np.float32)
+    origin = np.empty((n_progeny, len(genmap)), dtype=np.int8)
+
+    for chr_slice in chromosome_slices(genmap):
+        n_markers = chr_slice.stop - chr_slice.start
+        haps = np.empty((n_progeny, 2, n_markers), dtype=np.int8) # F1: one haplotype from each parent
+        haps[:, 0, :] = 1
+        haps[:, 1, :] = 2
+        r_chr = r[chr_slice][1:]
+        active = np.arange(n_progeny)
+        for _ in range(max_generations):
+            parents = haps[active]
+            haps[active, 0, :] = _meiosis(parents, r_chr, rng)
+            haps[active, 1, :] = _meiosis(parents, r_chr, rng)
+            segregating = (haps[active, 0, :] != haps[active, 1, :]).any(axis=1)
+            active = active[segregating]
+            if active.size == 0:
+                break
+        else:
+            raise RuntimeError(f"Lines are not fully inbred after {max_generations} generations of selfing.")
+        origin[:, chr_slice] = haps[:, 0, :]
+    return origin
+
+
+def _meiosis(haps, r, rng):
+    '''
+    Draw one gamete per individual.
+
+    haps: int8 array of shape (n, 2, n_markers).
+    r: recombination fractions of the n_markers - 1 intervals.
+    '''
+    n = haps.shape[0]
+    strand = np.empty((n, haps.shape[2]), dtype=bool)
+    strand[:, 0] = rng.integers(0, 2, size=n, dtype=np.int8).astype(bool)
+    if r.size:
+        crossover = rng.random((n, r.size), dtype=np.float32) < r
+        strand[:, 1:] = np.logical_xor.accumulate(crossover, axis=1) ^ strand[:, :1]
+    return np.where(strand, haps[:, 1, :], haps[:, 0, :])
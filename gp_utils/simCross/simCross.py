@@ -1,63 +1,135 @@
 import numpy as np
 import pandas as pd
-import rpy2.robjects as robjects
+
+from .ril import sim_ril_selfing
+from utils import get_backend
+from rbridge import register_r_function
+# from ..utils import get_backend
+# from ..rbridge import register_r_function
 
 ###########################
 ### R utility functions ###
 ###########################
-robjects.r('''
+register_r_function("read_cross", '''
     read_cross <- function(filename) {
-        library(qtl)
         genomap <- jittermap(pull.map(read.cross(format="csvr", file=filename)))
         return(genomap)
     }
+''', packages=["qtl"])
+register_r_function("map_snp_order", '''
     map_snp_order <- function(genomap) {
-        mapSNPorder <- names(genomap[[1]])
-        for (i in 2:20) {
-            mapSNPorder <- c(mapSNPorder, names(genomap[[i]]))
-        }
+        mapSNPorder <- unlist(lapply(genomap, names), use.names = FALSE)
         return(mapSNPorder)
     }
+''')
+register_r_function("sim_cross", '''
     sim_cross <- function(genomap, n_progeny) {
-        library(qtl)
         fake_cross <- sim.cross(map = genomap, n.ind = n_progeny, type = "riself", map.function = "morgan")$geno
         progeny_matrix <- do.call(cbind, lapply(fake_cross, function(chr) chr$data))
         return(progeny_matrix)
     }
-''')
+''', packages=["qtl"])
+
+def read_cross_func(filename):
+    '''Input is the path of a genetic map with empty. Returns a genetic map robject.'''
+    return get_backend("R").function("read_cross")(filename)
+
+def map_snp_order_func(genomap):
+    '''Input is a genetic map robject. Returns an r array of marker names ordered as the genetic map. Better to recast as python list.'''
+    return get_backend("R").function("map_snp_order")(genomap)
 
-read_cross_func = robjects.r['read_cross'] # Input is the path of a genetic map with empty. Returns a genetic map robject.
-map_snp_order_func = robjects.r['map_snp_order'] # Input is a genetic map robject. Returns an r array of marker names ordered as the genetic map. Better to recast as python list.
-_sim_cross_func = robjects.r['sim_cross'] # Input is a genetic map robject and the number of progeny to simulate. Return an r matrix where each row corresponds to a simulated progeny. Each component is either 1 or 2 indicating the parent.
+def _sim_cross_func(genomap, n_progeny):
+    '''Input is a genetic map robject and the number of progeny to simulate. Return an r matrix where each row corresponds to a simulated progeny. Each component is either 1 or 2 indicating the parent.'''
+    return get_backend("R").function("sim_cross")(genomap, n_progeny)
+
+
+def genmap_to_frame(genmap):
+    '''
+    Convert a genetic map robject from the qtl package into a pandas dataframe
+    indexed by marker name with columns "chr" and "pos" (cM), in map order.
+    '''
+    frames = []
+    for chrom, positions in zip(genmap.names, genmap):
+        frames.append(pd.DataFrame({"chr": str(chrom), "pos": np.asarray(positions, dtype=float)}, index=list(positions.names)))
+    res = pd.concat(frames)
+    res.index.name = "marker"
+    return res
 
 ########################################################
 ### Simulate progenies genotypes for a cross p1 x p2 ###
 ########################################################
-def sim_cross_with_genos(p1_geno, p2_geno, n_progeny, genmap, reduce_hetero=False, numeric_hetero_type=0):
+HETERO_RESAMPLE_PROBS = [15/32, 1/16, 15/32] # Genotype frequencies of a heterozygous locus after five generations of selfing.
+
+def sim_cross_with_genos(p1_geno, p2_geno, n_progeny, genmap, reduce_hetero=False, numeric_hetero_type=0, random_state=None, engine="R", map_function="morgan"):
     '''
     Design choice: supports different encodings. Naively copy values from parents without modification.
 
     Parameters
     ----------
     p1_geno, p2_geno: pandas series
-    genmap: robject genetic map object from qtl package
+    genmap: robject genetic map object from qtl package, or a map dataframe (see genmap_to_frame) for the numpy engine.
     reduce_hetero: if True, resample heterozygous markers. Used only when numeric encoding is used.
+    random_state: None, int or numpy Generator. Seeds the heterozygous resampling and the numpy engine.
+    engine: "R" calls qtl::sim.cross (reference implementation, always Morgan map function).
+            "numpy" uses the native simulator sim_ril_selfing.
+    map_function: "morgan", "haldane" or "kosambi". Used only by the numpy engine.
 
     Return:
     -------
     Pandas dataframe of shape (n_progeny, len(p1_geno))
     '''
-    progeny_mtx = np.array(_sim_cross_func(genmap, n_progeny))
-
-    numeric_marker = p1_geno.apply(lambda x: pd.isna(x) or isinstance(x, (int, float))).all() and p2_geno.apply(lambda x: pd.isna(x) or isinstance(x, (int, float))).all()
-
-    res = [[0] * progeny_mtx.shape[1] for _ in range(progeny_mtx.shape[0])]
-    for i in range(progeny_mtx.shape[0]):
-        for j in range(progeny_mtx.shape[1]):
-            source_parent = progeny_mtx[i, j]
-            val = p1_geno.iloc[j] if source_parent == 1 else p2_geno.iloc[j]
-            if reduce_hetero and numeric_marker:
-                res[i][j] = val if val != numeric_hetero_type else np.random.choice(a=[numeric_hetero_type-1, numeric_hetero_type, numeric_hetero_type+1], p=[15/32, 1/16, 15/32])
-            else:
-                res[i][j] = val
-    return pd.DataFrame(columns=p1_geno.index, data=res)
+    rng = np.random.default_rng(random_state)
+    if engine == "R":
+        origin = np.asarray(_sim_cross_func(genmap, n_progeny))
+    elif engine == "numpy":
+        if not isinstance(genmap, pd.DataFrame):
+            genmap = genmap_to_frame(genmap)
+        origin = sim_ril_selfing(genmap, n_progeny, map_function=map_function, random_state=rng)
+    else:
+        raise ValueError(f"Unsupported simulation engine: {engine}")
+
+    numeric_marker = _is_numeric_geno(p1_geno) and _is_numeric_geno(p2_geno)
+    progeny = _progeny_from_origin(
+        origin=origin,
+        p1=_geno_values(p1_geno, numeric_marker),
+        p2=_geno_values(p2_geno, numeric_marker),
+        reduce_hetero=reduce_hetero and numeric_marker,
+        numeric_hetero_type=numeric_hetero_type,
+        rng=rng
+    )
+    return pd.DataFrame(progeny, columns=p1_geno.index)
+
+
+def _progeny_from_origin(origin, p1, p2, reduce_hetero, numeric_hetero_type, rng):
+    '''
+    Build the progeny genotype matrix from a parent-of-origin matrix.
+
+    origin: array of shape (n_progeny, n_markers) with 1 (from p1) or 2 (from p2).
+    p1, p2: 1-D numpy arrays of parent genotypes, ordered as the columns of origin.
+    rng: numpy Generator used to resample heterozygous calls in bulk.
+    '''
+    progeny = np.where(origin == 1, p1[np.newaxis, :], p2[np.newaxis, :])
+    if reduce_hetero:
+        hetero = progeny == numeric_hetero_type
+        n_hetero = np.count_nonzero(hetero)
+        if n_hetero:
+            progeny[hetero] = rng.choice(
+                a=[numeric_hetero_type-1, numeric_hetero_type, numeric_hetero_type+1],
+                size=n_hetero,
+                p=HETERO_RESAMPLE_PROBS
+            )
+    return progeny
+
+
+def _is_numeric_geno(geno):
+    '''True if every value of the pandas series is missing or a number.'''
+    if pd.api.types.is_numeric_dtype(geno.dtype):
+        return True
+    return bool(geno.map(lambda x: pd.isna(x) or isinstance(x, (int, float))).all())
+
+
+def _geno_values(geno, numeric_marker):
+    '''Parent genotype series as a 1-D numpy array (float for mixed numeric object series).'''
+    if numeric_marker and not pd.api.types.is_numeric_dtype(geno.dtype):
+        return geno.to_numpy(dtype=float)
+    return geno.to_numpy()
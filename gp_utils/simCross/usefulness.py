@@ -0,0 +1,148 @@
+import heapq
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from .ril import recombination_fractions, ril_recombination_fractions, chromosome_slices
+from .genmap import reorder_to_map
+
+##########################################
+### Analytic cross usefulness for RILs ###
+##########################################
+def selection_intensity(r):
+    '''
+    Standardized selection intensity i when the top r portion of a normal population is selected.
+    '''
+    if not (0 < r <= 1):
+        raise ValueError("r must be in the interval (0, 1]")
+    if r == 1:
+        return 0.0
+    return stats.norm.pdf(stats.norm.ppf(1 - r)) / r
+
+
+def progeny_covariance_blocks(genmap, map_function="morgan"):
+    '''
+    Per-chromosome correlation matrices of the parent-of-origin indicators of RIL progeny.
+    Indicators of markers j and k on the same chromosome have correlation 1 - 2R_jk, where R_jk
+    is the RIL recombination fraction. Markers on different chromosomes are independent.
+
+    As in sim_ril_selfing, crossovers in different marker intervals are independent, so the
+    meiotic recombination fraction between two markers follows 1 - 2r_jk = prod(1 - 2r_i)
+    over the intervals between them.
+
+    Return:
+    -------
+    list of (column slice, numpy array) pairs, one per chromosome.
+    '''
+    r = np.minimum(recombination_fractions(genmap, map_function=map_function), 0.5 - 1e-12)
+    blocks = []
+    for chr_slice in chromosome_slices(genmap):
+        log_decay = np.concatenate(([0.0], np.cumsum(np.log1p(-2 * r[chr_slice][1:]))))
+        r_chr = 0.5 * (1 - np.exp(-np.abs(log_decay[:, np.newaxis] - log_decay[np.newaxis, :])))
+        blocks.append((chr_slice, 1 - 2 * ril_recombination_fractions(r_chr)))
+    return blocks
+
+
+def cross_usefulness(p1_geno, p2_geno, marker_effects, genmap, intercept=0.0, r=None, intensity=None, map_function="morgan"):
+    '''
+    Expected mean, genetic variance and usefulness (mean + i * sd) of the RIL progeny of p1 x p2,
+    for a marker-effect model predicting intercept + x @ marker_effects.
+
+    Assumes inbred parents. For models predicting on X + 1 (BayesAModel, BayesBModel, BayesLASSOModel)
+    pass intercept = beta + u.sum().
+
+    Parameters
+    ----------
+    p1_geno, p2_geno: numeric pandas series or numpy arrays ordered as genmap.
+    marker_effects: numpy array of marker effects ordered as genmap (e.g. RRBLUPModel.u).
+    r: selected portion used to derive the selection intensity (as in compute_top_mean).
+    intensity: selection intensity. Overrides r.
+
+    Return:
+    -------
+    dict with keys "mean", "variance", "sd" and "usefulness".
+    '''
+    p1, p2 = np.asarray(p1_geno, dtype=float), np.asarray(p2_geno, dtype=float)
+    u = np.asarray(marker_effects, dtype=float).ravel()
+    a = (p1 - p2) / 2 * u
+    variance = sum(a[chr_slice] @ corr @ a[chr_slice] for chr_slice, corr in progeny_covariance_blocks(genmap, map_function=map_function))
+    mean = (p1 + p2) / 2 @ u + intercept
+    sd = np.sqrt(max(variance, 0.0))
+    i = _intensity(r, intensity)
+    return {"mean": mean, "variance": variance, "sd": sd, "usefulness": mean + i * sd}
+
+
+def rank_crosses(parent_genos, marker_effects, genmap, intercept=0.0, r=None, intensity=None, top_k=100, block_size=256, map_function="morgan"):
+    '''
+    Rank all N(N-1)/2 crosses among the parents by usefulness without simulation.
+
+    Progeny variances come from the Gram matrix G = V C V' of effect-weighted parent genotypes
+    V = P * u under the block-diagonal progeny correlation C: var(a x b) = (G_aa + G_bb - 2 G_ab) / 4.
+    G is computed one block of parents at a time and only the best top_k crosses are kept.
+
+    Parameters
+    ----------
+    parent_genos: numeric pandas dataframe (parents x markers). Columns are reordered to genmap.
+    marker_effects: numpy array of marker effects ordered as genmap.
+    top_k: number of crosses returned.
+    block_size: number of parents per Gram matrix block.
+
+    Return:
+    -------
+    pandas dataframe with columns p1, p2, mean, variance, sd, usefulness sorted by decreasing usefulness.
+    '''
+    P = reorder_to_map(parent_genos, genmap).to_numpy(dtype=float)
+    u = np.asarray(marker_effects, dtype=float).ravel()
+    names = parent_genos.index.to_numpy()
+    n_parents = P.shape[0]
+    i = _intensity(r, intensity)
+
+    V = P * u
+    VC = np.empty_like(V)
+    for chr_slice, corr in progeny_covariance_blocks(genmap, map_function=map_function):
+        VC[:, chr_slice] = V[:, chr_slice] @ corr
+    g = P @ u
+    g_diag = np.einsum("ij,ij->i", VC, V)
+
+    heap = [] # min-heap of (usefulness, a, b, mean, variance)
+    for start in range(0, n_parents, block_size):
+        rows = np.arange(start, min(start + block_size, n_parents))
+        G = VC[rows] @ V.T
+        variance = (g_diag[rows, np.newaxis] + g_diag[np.newaxis, :] - 2 * G) / 4
+        mean = (g[rows, np.newaxis] + g[np.newaxis, :]) / 2 + intercept
+        usefulness = mean + i * np.sqrt(np.clip(variance, 0, None))
+        usefulness[np.arange(n_parents)[np.newaxis, :] <= rows[:, np.newaxis]] = -np.inf # Keep a < b only
+
+        # Candidates from this block that can enter the current top k
+        flat = usefulness.ravel()
+        n_candidates = min(top_k, np.count_nonzero(np.isfinite(flat)))
+        if n_candidates == 0:
+            continue
+        candidates = np.argpartition(flat, -n_candidates)[-n_candidates:]
+        for idx in candidates:
+            a, b = divmod(idx, n_parents)
+            item = (flat[idx], rows[a], b, mean[a, b], variance[a, b])
+            if len(heap) < top_k:
+                heapq.heappush(heap, item)
+            elif item[0] > heap[0][0]:
+                heapq.heapreplace(heap, item)
+
+    best = sorted(heap, reverse=True)
+    return pd.DataFrame({
+        "p1": [names[a] for _, a, _, _, _ in best],
+        "p2": [names[b] for _, _, b, _, _ in best],
+        "mean": [m for _, _, _, m, _ in best],
+        "variance": [v for _, _, _, _, v in best],
+        "sd": [np.sqrt(max(v, 0.0)) for _, _, _, _, v in best],
+        "usefulness": [uc for uc, _, _, _, _ in best]
+    })
+
+### Internal utilities ###
+def _intensity(r, intensity):
+    if intensity is not None:
+        return intensity
+    if r is None:
+        raise ValueError("Either r or intensity must be provided.")
+    return selection_intensity(r)
+
@@ -27,3 +27,25 @@ def check_r_environment():
 def ensure_r_ready():
     """Call this function before any R-interfacing operations."""
     check_r_environment()
+
+
+########################
+### Backend registry ###
+########################
+_BACKEND_LOADERS = {} # name -> zero-argument function that starts the backend
+_BACKENDS = {} # name -> loaded backend, shared by every caller in the process
+
+def register_backend(name, loader):
+    """Register a backend loader. The loader runs on the first get_backend(name) call."""
+    _BACKEND_LOADERS[name] = loader
+
+def get_backend(name):
+    """Return the loaded backend, starting it on first use."""
+    if name not in _BACKENDS:
+        if name not in _BACKEND_LOADERS:
+            raise ValueError(f"Unknown backend: {name}")
+        _BACKENDS[name] = _BACKEND_LOADERS[name]()
+    return _BACKENDS[name]
+
+def backend_loaded(name):
+    return name in _BACKENDS
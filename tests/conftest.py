@@ -0,0 +1,10 @@
+import os
+import sys
+
+# gp_utils subpackages import each other by top-level name (e.g. "from preprocessing import ..."),
+# so both the repository root and the package directory must be importable.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_DIR = os.path.join(ROOT, "gp_utils")
+for path in (ROOT, PACKAGE_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing import GenotypeMatrix, GenotypePreprocessor
+from reducers import LassoReducer
+from models import RRBLUPModel, BayesAModel
+from pipeline import init_pipeline
+
+PREPROCESS_PARAMS = {"imputation-strategy": "mean", "imputation-fill-value": None}
+
+
+def _panel(n=150, p=120, missing_rate=0.01, seed=0):
+    '''Genotype dataframe {-1, 0, 1} with missing calls (NaN), one constant marker, and a trait.'''
+    rng = np.random.default_rng(seed)
+    G = rng.integers(-1, 2, size=(n, p)).astype(float)
+    y = pd.Series(G[:, :10].sum(axis=1) + rng.normal(size=n))
+    G[rng.random((n, p)) < missing_rate] = np.nan
+    G[:, 3] = 1.0
+    X = pd.DataFrame(G, index=[f"s{i}" for i in range(n)], columns=[f"m{j}" for j in range(p)])
+    return X, y
+
+
+def test_models_and_reducers_reject_missing_calls():
+    X, y = _panel()
+    G = GenotypeMatrix.from_array(X)
+    with pytest.raises(ValueError, match="missing genotypes"):
+        RRBLUPModel(backend="numpy").fit(G, y)
+    with pytest.raises(ValueError, match="missing genotypes"):
+        LassoReducer(n_reps=2).fit(G, y)
+    model = RRBLUPModel(backend="numpy").fit(X.fillna(0.0), y)
+    with pytest.raises(ValueError, match="missing genotypes"):
+        model.predict(G)
+    model = BayesAModel(backend="numpy", n_iter=20, burn_in=10, random_state=0).fit(X.fillna(0.0), y)
+    with pytest.raises(ValueError, match="missing genotypes"):
+        model.predict(G)
+
+
+def test_complete_matrix_predicts_as_array():
+    X, y = _panel()
+    X = X.fillna(0.0)
+    G = GenotypeMatrix.from_array(X)
+    model = RRBLUPModel(backend="numpy").fit(G, y)
+    assert np.allclose(model.predict(G), model.predict(X.to_numpy()), atol=1e-4)
+
+
+@pytest.mark.parametrize("fused", [False, True])
+def test_pipeline_imputes_genotype_matrix(fused):
+    X, y = _panel()
+    G = GenotypeMatrix.from_array(X)
+    params = PREPROCESS_PARAMS | {"fused-preprocessing": fused}
+    from_frame = init_pipeline("NoFS", "RRBLUP", params, {}, {"backend": "numpy"}).fit(X, y)
+    from_matrix = init_pipeline("NoFS", "RRBLUP", params, {}, {"backend": "numpy"}).fit(G, y)
+    pred = from_matrix.predict(G)
+    assert np.isfinite(pred).all()
+    assert np.allclose(pred, from_frame.predict(X), atol=1e-4) # The packed path decodes to float32
+
+
+def test_genotype_preprocessor_matches_on_matrix_and_frame():
+    X, _ = _panel()
+    from_frame = GenotypePreprocessor().fit_transform(X)
+    from_matrix = GenotypePreprocessor().fit_transform(GenotypeMatrix.from_array(X))
+    assert from_frame.shape[1] == X.shape[1] - 1 # The constant marker is dropped
+    assert np.allclose(from_frame, from_matrix)
+
+
+def test_matrix_built_through_gp_utils():
+    import gp_utils # Its GenotypeMatrix class is distinct from the top-level preprocessing one
+    X, y = _panel()
+    G = gp_utils.GenotypeMatrix.from_array(X)
+    complete = gp_utils.GenotypeMatrix.from_array(X.fillna(0.0))
+    model = gp_utils.RRBLUPModel(backend="numpy").fit(complete, y)
+    assert np.allclose(model.predict(complete), RRBLUPModel(backend="numpy").fit(X.fillna(0.0), y).predict(X.fillna(0.0).to_numpy()), atol=1e-4)
+    pipe = gp_utils.init_pipeline("NoFS", "RRBLUP", PREPROCESS_PARAMS, {}, {"backend": "numpy"}).fit(G, y)
+    assert np.isfinite(pipe.predict(G)).all()
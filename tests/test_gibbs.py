@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from models import BayesAModel, BayesBModel, BayesLASSOModel
+
+MODELS = {"BayesA": BayesAModel, "BayesB": BayesBModel, "BayesLASSO": BayesLASSOModel}
+
+
+def _sparse_panel(n=300, p=40, seed=0):
+    '''Genotypes {-1, 0, 1} and a trait driven by 3 large marker effects, with noise variance 0.25.'''
+    rng = np.random.default_rng(seed)
+    X = rng.integers(-1, 2, size=(n, p)).astype(float)
+    b = np.zeros(p)
+    b[[3, 17, 31]] = [1.5, -1.0, 2.0]
+    return X, X @ b + 5.0 + rng.normal(scale=0.5, size=n), b
+
+
+@pytest.mark.parametrize("prior", list(MODELS))
+def test_gibbs_recovers_sparse_effects(prior):
+    X, y, b = _sparse_panel()
+    model = MODELS[prior](backend="numpy", n_iter=600, burn_in=200, random_state=0).fit(X, y)
+    assert np.all(np.isfinite(model.u))
+    assert np.abs(model.u - b).max() < 0.15
+    assert set(np.argsort(-np.abs(model.u))[:3]) == set(np.flatnonzero(b))
+    assert np.abs(model.predict(X) - (X @ b + 5.0)).mean() < 0.25
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+from conftest import ROOT, PACKAGE_DIR
+
+# Records every attempt to import rpy2 (even one whose ImportError is caught), then imports gp_utils.
+IMPORT_SCRIPT = '''
+import sys
+
+class RecordR:
+    attempts = []
+    def find_spec(self, name, path=None, target=None):
+        if name.split(".")[0] == "rpy2":
+            self.attempts.append(name)
+        return None
+
+sys.meta_path.insert(0, RecordR())
+import gp_utils
+import utils
+print("attempts:", RecordR.attempts)
+print("loaded:", "rpy2" in sys.modules, utils.backend_loaded("R"))
+'''
+
+
+def _import_gp_utils():
+    env = os.environ | {"PYTHONPATH": os.pathsep.join([ROOT, PACKAGE_DIR])}
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", IMPORT_SCRIPT], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+
+
+def test_import_does_not_load_r():
+    result = _import_gp_utils()
+    assert "attempts: []" in result.stdout
+    assert "loaded: False False" in result.stdout
+    imported = [line.rsplit("|", 1)[-1].strip() for line in result.stderr.splitlines() if line.startswith("import time:")]
+    assert "gp_utils" in imported
+    assert not any(name.split(".")[0] == "rpy2" for name in imported)
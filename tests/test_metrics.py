@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from evaluations import (
+    pear_metric, spear_metric, top_r_portion_hit_rate, report_metrics, compute_top_mean,
+    pearson_batch, spearman_batch, top_r_hit_rate_batch, top_mean_batch, report_metrics_batch, bootstrap_ci
+)
+
+
+def _units(tied, n_units=40, n=97, seed=0):
+    rng = np.random.default_rng(seed)
+    if tied: # Few distinct values, so the top-k boundary falls inside runs of ties
+        return rng.integers(0, 4, size=(n_units, n)).astype(float), rng.integers(0, 3, size=(n_units, n)).astype(float)
+    Y_true = rng.normal(size=(n_units, n))
+    return Y_true, Y_true + rng.normal(size=(n_units, n))
+
+
+@pytest.mark.parametrize("tied", [False, True])
+@pytest.mark.parametrize("r", [0.05, 0.25, 0.5])
+def test_hit_rates_match_scalar(tied, r):
+    Y_true, Y_pred = _units(tied)
+    expected = [top_r_portion_hit_rate(y_true, y_pred, r=r) for y_true, y_pred in zip(Y_true, Y_pred)]
+    assert np.array_equal(top_r_hit_rate_batch(Y_true, Y_pred, r=r), expected)
+    assert np.array_equal(top_mean_batch(Y_pred, r), [compute_top_mean(y, r) for y in Y_pred])
+
+
+@pytest.mark.parametrize("tied", [False, True])
+def test_report_metrics_match_scalar(tied):
+    Y_true, Y_pred = _units(tied)
+    batch = report_metrics_batch(Y_true, Y_pred)
+    for i, (y_true, y_pred) in enumerate(zip(Y_true, Y_pred)):
+        scalar = report_metrics(y_true, y_pred)
+        assert batch.iloc[i]["Pearson's r"] == pytest.approx(scalar["Pearson's r"], abs=1e-12)
+        assert batch.iloc[i]["Top 25% HR"] == scalar["Top 25% HR"]
+        assert batch.iloc[i]["Low 25% HR"] == scalar["Low 25% HR"]
+    assert np.allclose(pearson_batch(Y_true, Y_pred), [pear_metric(a, b) for a, b in zip(Y_true, Y_pred)], rtol=0, atol=1e-12)
+    assert np.allclose(spearman_batch(Y_true, Y_pred), [spear_metric(a, b) for a, b in zip(Y_true, Y_pred)], rtol=0, atol=1e-12)
+
+
+def test_bootstrap_ci_chunks_by_values():
+    Y_true, Y_pred = _units(False, n_units=3, n=500)
+    lower, upper = bootstrap_ci(Y_true, Y_pred, n_boot=200, random_state=0, max_values=10_000) # Resamples split within units
+    assert lower.shape == upper.shape == (3,)
+    assert (lower < pearson_batch(Y_true, Y_pred)).all() and (pearson_batch(Y_true, Y_pred) < upper).all()
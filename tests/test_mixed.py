@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from models import RRBLUPModel
+from models.mixed import mixed_solve
+
+
+def _traits(n, p, n_traits=3, seed=0):
+    '''Genotypes {-1, 0, 1} and traits of heritability 0.3 to 0.7 (one column per trait).'''
+    rng = np.random.default_rng(seed)
+    Z = rng.integers(-1, 2, size=(n, p)).astype(np.float32)
+    h2 = np.linspace(0.3, 0.7, n_traits)
+    effects = rng.normal(size=(p, n_traits)) * np.sqrt(h2 / (1 - h2) / (p * 2 / 3)) # Genotype variance 2/3
+    return Z, Z @ effects + rng.normal(size=(n, n_traits))
+
+
+@pytest.mark.parametrize("n, p", [(40, 120), (120, 40)]) # Kernel space and marker space
+def test_multi_trait_matches_single_trait_fits(n, p):
+    Z, Y = _traits(n, p)
+    joint = mixed_solve(Y, Z)
+    for t in range(Y.shape[1]):
+        single = mixed_solve(Y[:, t], Z)
+        for key in ("u", "beta"):
+            assert np.allclose(joint[key][:, t], single[key], rtol=1e-6, atol=1e-8)
+        for key in ("Vu", "Ve", "LL"):
+            assert np.isclose(joint[key][t], single[key], rtol=1e-6)
+
+
+def test_multi_trait_model_predicts_each_trait():
+    Z, Y = _traits(60, 80)
+    joint = RRBLUPModel(backend="numpy").fit(Z, Y).predict(Z)
+    for t in range(Y.shape[1]):
+        single = RRBLUPModel(backend="numpy").fit(Z, Y[:, t]).predict(Z)
+        assert np.allclose(joint[:, t], single, atol=1e-5)
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+from pipeline import init_pipeline
+from reducers import LDPruneReducer
+
+PREPROCESS_PARAMS = {"imputation-strategy": "mean", "imputation-fill-value": None}
+
+
+def _ld_panel(n=80, p=40, seed=0):
+    '''Markers in pairs of perfect LD over two chromosomes, with one constant marker.'''
+    rng = np.random.default_rng(seed)
+    G = rng.integers(-1, 2, size=(n, p)).astype(float)
+    G[:, 1::2] = G[:, 0::2]
+    columns = [f"m{i}" for i in range(p)]
+    X = pd.DataFrame(G, columns=columns)
+    X["m5"] = 1.0
+    genmap = pd.DataFrame({"chr": ["1"] * (p // 2) + ["2"] * (p - p // 2), "pos": np.arange(p, dtype=float)}, index=columns)
+    return X, pd.Series(G @ rng.normal(size=p)), genmap
+
+
+def test_ld_prune_resolves_chromosomes_by_name_in_pipeline():
+    X, y, genmap = _ld_panel()
+    for fused in (False, True):
+        pipeline = init_pipeline(
+            "LDFS", "RRBLUP", PREPROCESS_PARAMS | {"fused-preprocessing": fused},
+            {"threshold": 0.9, "window": 5, "chromosomes": genmap}, {"backend": "numpy"}
+        )
+        pipeline.fit(X, y) # The constant marker is dropped before the reducer
+        assert pipeline.named_steps["LDFS"].support_.size == X.shape[1] // 2
+        assert np.isfinite(pipeline.predict(X)).all()
+
+
+def test_ld_prune_mapping_matches_per_column_labels():
+    X, y, genmap = _ld_panel()
+    X = X.drop(columns="m5")
+    by_name = LDPruneReducer(window=5, threshold=0.9, chromosomes=genmap["chr"].to_dict()).fit(X, y)
+    by_column = LDPruneReducer(window=5, threshold=0.9, chromosomes=genmap.loc[X.columns, "chr"].tolist()).fit(X.to_numpy(), y)
+    assert np.array_equal(by_name.support_, by_column.support_)
+
+
+def test_pipelines_with_other_reducers_fit():
+    X, y, _ = _ld_panel()
+    for reducer_name, reducer_params in [("NoFS", {}), ("LASSOFS", {"alpha": 0.05, "test_size": 0.2, "n_reps": 4, "r": 0.1})]:
+        pipeline = init_pipeline(reducer_name, "RRBLUP", PREPROCESS_PARAMS, reducer_params, {"backend": "numpy"})
+        assert np.isfinite(pipeline.fit(X, y).predict(X)).all()
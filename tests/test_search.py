@@ -0,0 +1,29 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from pipeline.search import _share_data, _load_shared
+
+
+def test_shared_frames_are_memory_mapped_values(tmp_path):
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.integers(-1, 2, size=(20, 6)).astype(np.float32), index=[f"s{i}" for i in range(20)], columns=[f"m{j}" for j in range(6)])
+    y = pd.Series(rng.normal(size=20), index=X.index, name="trait")
+    paths = _share_data(X, y, str(tmp_path))
+    assert all(path.endswith(".npy") for path in paths.values())
+    X_shared, y_shared = _load_shared(paths["X"]), _load_shared(paths["y"])
+    pd.testing.assert_frame_equal(X_shared, X)
+    pd.testing.assert_series_equal(y_shared, y)
+    base = X_shared.to_numpy()
+    while base.base is not None and not isinstance(base, np.memmap):
+        base = base.base
+    assert isinstance(base, np.memmap) # Values are not copied out of the memory map
+
+
+def test_mixed_dtype_frames_are_pickled(tmp_path):
+    X = pd.DataFrame({"a": [1.0, 2.0], "b": ["AA", "AG"]})
+    paths = _share_data(X, np.arange(2.0), str(tmp_path))
+    assert paths["X"].endswith(".pkl") and os.path.exists(paths["X"])
+    pd.testing.assert_frame_equal(_load_shared(paths["X"]), X)
+    assert np.array_equal(_load_shared(paths["y"]), np.arange(2.0))
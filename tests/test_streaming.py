@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from preprocessing import read_genotypes, str2numConverter
+
+
+def _write(path, frame, blank_lines):
+    '''Write frame as CSV, followed by blank and whitespace-only lines.'''
+    path.write_text(frame.to_csv() + blank_lines)
+    return path
+
+
+@pytest.mark.parametrize("blank_lines", ["\n", "\n\n  \n"])
+def test_trailing_blank_lines_are_not_rows(tmp_path, blank_lines):
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame(rng.integers(-1, 2, size=(6, 5)), index=[f"s{i}" for i in range(6)], columns=[f"m{j}" for j in range(5)])
+    G, samples, markers = read_genotypes(_write(tmp_path / "numeric.csv", frame, blank_lines))
+    assert G.shape == (6, 5)
+    assert samples == frame.index.tolist() and markers == frame.columns.tolist()
+    assert np.array_equal(G, frame.to_numpy())
+
+
+@pytest.mark.parametrize("blank_lines", ["\n", "\n\n  \n"])
+def test_unlabeled_allele_calls_with_trailing_blank_lines(tmp_path, blank_lines):
+    rng = np.random.default_rng(1)
+    calls = np.array([["AA", "AG", "GG"], ["CC", "CT", "TT"]], dtype=object)
+    frame = pd.DataFrame(
+        np.column_stack([calls[j % 2][rng.integers(0, 3, size=6)] for j in range(5)]),
+        index=[f"s{i}" for i in range(6)], columns=[f"m{j}" for j in range(5)]
+    )
+    G, _, _ = read_genotypes(_write(tmp_path / "alleles.csv", frame, blank_lines), chunksize=4)
+    expected = str2numConverter(dtype=np.int8).fit_transform(frame)
+    assert G.shape == (6, 5)
+    assert np.array_equal(G, np.asarray(expected))